@@ -1,13 +1,26 @@
 
 import os
+import re
+import csv
+import codecs
+import hashlib
 import logging
 import json
 import base64
 import io
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, make_response
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, make_response, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -25,9 +38,15 @@ try:
 except ImportError:
     BARCODE_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 try:
     from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+    from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, PageBreak
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.units import inch
     from reportlab.lib import colors
@@ -158,6 +177,7 @@ class Product(db.Model):
     total_sold = db.Column(db.Integer, nullable=False, default=0)
     total_revenue = db.Column(db.Float, nullable=False, default=0)
     is_active = db.Column(db.Boolean, default=True)
+    catalog_version = db.Column(db.Integer, nullable=False, default=0, index=True)  # set by database triggers
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -166,6 +186,7 @@ class Product(db.Model):
     service_costs = db.relationship('ServiceCost', backref='product', cascade='all, delete-orphan')
     maintenance_costs = db.relationship('MaintenanceCost', backref='product', cascade='all, delete-orphan')
     inventory_items = db.relationship('InventoryItem', backref='product', cascade='all, delete-orphan')
+    forecast = db.relationship('ProductForecast', uselist=False, cascade='all, delete-orphan')
     
     def calculate_profit(self, additional_stock=0):
         """Calculate profit based on purchase price, selling price, and items sold
@@ -248,6 +269,108 @@ class MaintenanceCost(db.Model):
     annual_cost = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Counter(db.Model):
+    """Named persistent counter"""
+    __tablename__ = 'counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class CatalogDeletion(db.Model):
+    """Tombstone of a deleted product for catalog delta sync"""
+    __tablename__ = 'catalog_deletions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StockMovement(db.Model):
+    """Append-only ledger entry of a stock change of a product or inventory item"""
+    __tablename__ = 'stock_movements'
+    __table_args__ = (
+        db.Index('ix_stock_movements_product_time', 'product_id', 'timestamp'),
+        db.Index('ix_stock_movements_item_time', 'inventory_item_id', 'timestamp'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(50))
+    inventory_item_id = db.Column(db.Integer)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(30), nullable=False)  # initial, sale, purchase, adjustment, import, stock_take
+    reference = db.Column(db.String(100))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class StockSnapshot(db.Model):
+    """Stock of a product or inventory item at a point in time, covering ledger entries up to last_movement_id"""
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (
+        db.Index('ix_stock_snapshots_product_time', 'product_id', 'snapshot_at'),
+        db.Index('ix_stock_snapshots_item_time', 'inventory_item_id', 'snapshot_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(50))
+    inventory_item_id = db.Column(db.Integer)
+    stock = db.Column(db.Integer, nullable=False)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    snapshot_at = db.Column(db.DateTime, nullable=False)
+
+class LowStockWatch(db.Model):
+    """Product or inventory item at or below its minimum stock, maintained by database triggers"""
+    __tablename__ = 'low_stock_watchlist'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(50), unique=True)
+    inventory_item_id = db.Column(db.Integer, unique=True)
+    current_stock = db.Column(db.Integer, nullable=False)
+    minimum_stock = db.Column(db.Integer, nullable=False)
+    flagged_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductForecast(db.Model):
+    """Sales velocity forecast of a product, recomputed by compute_product_forecasts"""
+    __tablename__ = 'product_forecasts'
+    
+    product_id = db.Column(db.String(50), db.ForeignKey('products.id'), primary_key=True)
+    avg_daily_7 = db.Column(db.Float, nullable=False, default=0)
+    avg_daily_30 = db.Column(db.Float, nullable=False, default=0)
+    smoothed_daily = db.Column(db.Float, nullable=False, default=0)  # exponential smoothing of daily sales
+    days_until_stockout = db.Column(db.Float, index=True)  # NULL when there is no recent demand
+    reorder_point = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)  # over the forecast window
+    abc_class = db.Column(db.String(1), nullable=False, default='C', index=True)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+
+class StockTake(db.Model):
+    """Physical stock count session; counts accumulate until the session is applied"""
+    __tablename__ = 'stock_takes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, applied, cancelled
+    notes = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    applied_at = db.Column(db.DateTime)
+    
+    creator = db.relationship('User')
+
+class StockTakeCount(db.Model):
+    """Counted quantity of one product or inventory item in a stock take"""
+    __tablename__ = 'stock_take_counts'
+    __table_args__ = (
+        db.UniqueConstraint('stock_take_id', 'product_id', name='uq_stock_take_counts_product'),
+        db.UniqueConstraint('stock_take_id', 'inventory_item_id', name='uq_stock_take_counts_item'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_takes.id'), nullable=False)
+    product_id = db.Column(db.String(50), db.ForeignKey('products.id'))
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_items.id'))
+    counted = db.Column(db.Integer, nullable=False, default=0)
+    expected = db.Column(db.Integer)  # system stock when the stock take was applied
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
 # Savings Models
 class Saver(db.Model):
     __tablename__ = 'savers'
@@ -256,22 +379,13 @@ class Saver(db.Model):
     name = db.Column(db.String(100), nullable=False, unique=True)
     phone = db.Column(db.String(20))
     address = db.Column(db.Text)
+    balance = db.Column(db.Float, nullable=False, default=0)  # maintained by apply_savings_transaction
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     transactions = db.relationship('SavingsTransaction', backref='saver', lazy=True, cascade='all, delete-orphan')
     
     def get_balance(self):
-        deposits = db.session.query(db.func.sum(SavingsTransaction.amount)).filter(
-            SavingsTransaction.saver_id == self.id,
-            SavingsTransaction.type == 'deposit'
-        ).scalar() or 0
-        
-        withdrawals = db.session.query(db.func.sum(SavingsTransaction.amount)).filter(
-            SavingsTransaction.saver_id == self.id,
-            SavingsTransaction.type == 'withdrawal'
-        ).scalar() or 0
-        
-        return deposits - withdrawals
+        return self.balance or 0
 
 class SavingsTransaction(db.Model):
     __tablename__ = 'savings_transactions'
@@ -285,12 +399,21 @@ class SavingsTransaction(db.Model):
     balance_after = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class SaverBalanceSnapshot(db.Model):
+    """Balance of a saver at the end of a month with transactions, kept in sync by database triggers"""
+    __tablename__ = 'saver_balance_snapshots'
+    
+    saver_id = db.Column(db.Integer, db.ForeignKey('savers.id'), primary_key=True)
+    month_end = db.Column(db.Date, primary_key=True)  # last day of the month, inclusive
+    balance = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
 # Transaction Models
 class CashierTransaction(db.Model):
     __tablename__ = 'cashier_transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
     items = db.Column(db.Text, nullable=False)  # JSON string
     total = db.Column(db.Float, nullable=False)
     profit = db.Column(db.Float, nullable=False)
@@ -298,6 +421,40 @@ class CashierTransaction(db.Model):
     change_amount = db.Column(db.Float, nullable=False)
     cashier_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    lines = db.relationship('SaleLine', backref='transaction', cascade='all, delete-orphan')
+
+class SaleLine(db.Model):
+    """Normalized line item of a cashier transaction"""
+    __tablename__ = 'sale_lines'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('cashier_transactions.id'), nullable=False, index=True)
+    product_id = db.Column(db.String(50), index=True)
+    product_name = db.Column(db.String(255))
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False, default=0)
+    unit_cost = db.Column(db.Float, nullable=False, default=0)
+    subtotal = db.Column(db.Float, nullable=False, default=0)
+
+class SaleSyncKey(db.Model):
+    """Client-generated idempotency key of a sale synced from a POS terminal"""
+    __tablename__ = 'sale_sync_keys'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('cashier_transactions.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DailySales(db.Model):
+    """Per day, per cashier sales rollup maintained alongside each sale"""
+    __tablename__ = 'daily_sales'
+    
+    date = db.Column(db.Date, primary_key=True)
+    cashier_id = db.Column(db.Integer, primary_key=True, default=0)  # 0 when the sale has no cashier
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    profit = db.Column(db.Float, nullable=False, default=0)
+    items = db.Column(db.Integer, nullable=False, default=0)
 
 # Invoice Models
 class Invoice(db.Model):
@@ -369,30 +526,70 @@ def format_date_indonesian(date):
     }
     return f"{date.day} {months[date.month]} {date.year}"
 
+PRODUCT_ID_COUNTER = 'product_id'
+PRODUCT_ID_BLOCK_SIZE = 20  # IDs each process reserves at once for single adds
+
+_product_id_block = []
+_product_id_lock = threading.Lock()
+
+def reserve_product_ids(count, connection=None, skip=()):
+    """Reserve a block of `count` sequential PRD product IDs from the counters table
+    
+    The block is taken with one atomic UPDATE, and IDs already used by manually
+    entered products (or listed in `skip`) are skipped with one IN query per
+    block. Runs on the given connection, or in the current session transaction.
+    """
+    executor = connection if connection is not None else db.session
+    product_ids = []
+    while len(product_ids) < count:
+        needed = count - len(product_ids)
+        executor.execute(db.text(
+            "INSERT OR IGNORE INTO counters (name, value) VALUES (:name, 0)"
+        ), {'name': PRODUCT_ID_COUNTER})
+        end = executor.execute(db.text(
+            "UPDATE counters SET value = value + :count WHERE name = :name RETURNING value"
+        ), {'name': PRODUCT_ID_COUNTER, 'count': needed}).scalar()
+        
+        candidates = [f"PRD{value:08d}" for value in range(end - needed + 1, end + 1)]
+        taken = set(executor.execute(db.select(Product.id).where(Product.id.in_(candidates))).scalars())
+        taken.update(product_id for product_id in candidates if product_id in skip)
+        product_ids.extend(product_id for product_id in candidates if product_id not in taken)
+    
+    return product_ids
+
 def generate_product_id():
-    """Generate unique product ID with timestamp-based format"""
-    import time
-    import random
-    
-    # Generate ID with timestamp and random component
-    timestamp = int(time.time() * 1000) % 100000000  # 8 digits
-    random_part = random.randint(1000, 9999)  # 4 digits
-    base_id = f"PRD{timestamp}{random_part}"
-    
-    # Ensure uniqueness
-    counter = 1
-    product_id = base_id
-    while Product.query.get(product_id):
-        product_id = f"{base_id}{counter:02d}"
-        counter += 1
-        if len(product_id) > 50:  # Safety check
-            # Fallback to shorter format if too long
-            short_id = f"PRD{random.randint(100000, 999999)}"
-            while Product.query.get(short_id):
-                short_id = f"PRD{random.randint(100000, 999999)}"
-            return short_id
-    
-    return product_id
+    """Next unique PRD product ID from a block reserved by this process
+    
+    Blocks are reserved in their own short transaction, so concurrent adds on
+    other workers get disjoint IDs without probing or retrying.
+    """
+    with _product_id_lock:
+        if not _product_id_block:
+            with db.engine.begin() as connection:
+                _product_id_block.extend(reserve_product_ids(PRODUCT_ID_BLOCK_SIZE, connection))
+        return _product_id_block.pop(0)
+
+def reserved_product_id_limit(connection=None):
+    """Highest PRD number handed out in reserved blocks so far, used or not"""
+    executor = connection if connection is not None else db.session
+    return executor.execute(db.text(
+        "SELECT value FROM counters WHERE name = :name"
+    ), {'name': PRODUCT_ID_COUNTER}).scalar() or 0
+
+def is_reserved_product_id(product_id, limit):
+    """True when a manual ID falls in the PRD range reserved for generated IDs
+    
+    IDs above the range are safe, reserve_product_ids skips them once taken.
+    """
+    return (len(product_id) == 11 and product_id.startswith('PRD')
+            and product_id[3:].isdigit() and int(product_id[3:]) <= limit)
+
+def peek_product_id():
+    """Likely next generated PRD ID, for display only; nothing is reserved"""
+    with _product_id_lock:
+        if _product_id_block:
+            return _product_id_block[0]
+    return f"PRD{reserved_product_id_limit() + 1:08d}"
 
 def is_valid_product_id(product_id):
     """Validate product ID format - max 50 characters, alphanumeric + underscore/dash"""
@@ -418,6 +615,1130 @@ def generate_qr_data(product_id, product_name):
     """Generate QR code data for product"""
     return f"QR{product_id}|{product_name}|{datetime.now().strftime('%Y%m%d')}"
 
+def get_best_selling_items(start_date, end_date=None, limit=10):
+    """Get best selling products as (name, quantity) pairs from sale lines
+    
+    end_date is exclusive, pass the day after the last day of the period.
+    """
+    total_quantity = db.func.sum(SaleLine.quantity).label('total_quantity')
+    query = db.session.query(
+        db.func.max(SaleLine.product_name),
+        total_quantity
+    ).join(CashierTransaction, SaleLine.transaction_id == CashierTransaction.id).filter(
+        CashierTransaction.timestamp >= start_date
+    )
+    if end_date is not None:
+        query = query.filter(CashierTransaction.timestamp < end_date)
+    
+    rows = query.group_by(SaleLine.product_id).order_by(total_quantity.desc()).limit(limit).all()
+    return [(name or 'Item tidak diketahui', int(quantity or 0)) for name, quantity in rows]
+
+# Product search index (SQLite FTS5), kept in sync by triggers on products
+PRODUCT_SEARCH_FTS_AVAILABLE = False
+PRODUCT_SEARCH_DEFAULT_LIMIT = 20
+PRODUCT_SEARCH_MAX_LIMIT = 100
+
+def init_product_search_index():
+    """Create the FTS5 product search table and its sync triggers
+    
+    Each FTS row uses its product's rowid, so the triggers update and delete
+    single rows by rowid instead of scanning the index for a product_id.
+    """
+    global PRODUCT_SEARCH_FTS_AVAILABLE
+    
+    statements = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            product_id, name, barcode, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+        )""",
+        "DROP TRIGGER IF EXISTS products_fts_insert",
+        "DROP TRIGGER IF EXISTS products_fts_delete",
+        "DROP TRIGGER IF EXISTS products_fts_update",
+        """CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, product_id, name, barcode) VALUES (new.rowid, new.id, new.name, new.barcode);
+        END""",
+        """CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.rowid;
+        END""",
+        """CREATE TRIGGER products_fts_update AFTER UPDATE OF id, name, barcode ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.rowid;
+            INSERT INTO products_fts (rowid, product_id, name, barcode) VALUES (new.rowid, new.id, new.name, new.barcode);
+        END"""
+    ]
+    
+    try:
+        for statement in statements:
+            db.session.execute(db.text(statement))
+        
+        # Rebuild when rows are missing or keyed by another rowid (older index, or VACUUM renumbered products)
+        indexed = db.session.execute(db.text("SELECT COUNT(*) FROM products_fts")).scalar()
+        matched = db.session.execute(db.text(
+            "SELECT COUNT(*) FROM products_fts f JOIN products p ON p.rowid = f.rowid AND p.id = f.product_id"
+        )).scalar()
+        if indexed != matched or matched != Product.query.count():
+            rebuild_product_search_index()
+        
+        db.session.commit()
+        PRODUCT_SEARCH_FTS_AVAILABLE = True
+    except Exception as e:
+        db.session.rollback()
+        PRODUCT_SEARCH_FTS_AVAILABLE = False
+        print(f"Product search index not available, using LIKE search: {e}")
+
+def rebuild_product_search_index():
+    """Rebuild the FTS5 product search table from the products table"""
+    db.session.execute(db.text("DELETE FROM products_fts"))
+    db.session.execute(db.text(
+        "INSERT INTO products_fts (rowid, product_id, name, barcode) SELECT rowid, id, name, barcode FROM products"
+    ))
+
+def search_products(query, limit=PRODUCT_SEARCH_DEFAULT_LIMIT):
+    """Search active in-stock products by ID, name or barcode prefix, best match first"""
+    limit = max(1, min(limit, PRODUCT_SEARCH_MAX_LIMIT))
+    columns = (Product.id, Product.name, Product.barcode, Product.selling_price, Product.current_stock)
+    base_query = db.session.query(*columns).filter(
+        Product.current_stock > 0,
+        Product.is_active == True
+    )
+    
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return base_query.order_by(Product.name).limit(limit).all()
+    
+    if PRODUCT_SEARCH_FTS_AVAILABLE:
+        # Every term must match as a prefix of a token in id, name or barcode
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return db.session.execute(db.text("""
+            SELECT p.id, p.name, p.barcode, p.selling_price, p.current_stock
+            FROM products_fts
+            JOIN products p ON p.rowid = products_fts.rowid
+            WHERE products_fts MATCH :match AND p.current_stock > 0 AND p.is_active = 1
+            ORDER BY bm25(products_fts, 10.0, 1.0, 10.0)
+            LIMIT :limit
+        """), {'match': match, 'limit': limit}).all()
+    
+    pattern = f'%{query.strip()}%'
+    return base_query.filter(db.or_(
+        Product.id.ilike(pattern),
+        Product.name.ilike(pattern),
+        Product.barcode.ilike(pattern)
+    )).order_by(Product.name).limit(limit).all()
+
+# In-memory scan index for exact barcode/code lookups
+SCAN_INDEX_TTL = 300  # seconds before another worker's product edits show up in scans
+MAX_SCAN_CODES = 200
+
+class ScanRecord:
+    """Compact product record held in the in-memory scan index"""
+    __slots__ = ('product_id', 'name', 'barcode', 'selling_price', 'unit')
+    
+    def __init__(self, product_id, name, barcode, selling_price, unit):
+        self.product_id = product_id
+        self.name = name
+        self.barcode = barcode
+        self.selling_price = selling_price
+        self.unit = unit
+    
+    def to_dict(self):
+        return {
+            'kode': self.product_id,
+            'nama': self.name,
+            'harga_jual': self.selling_price,
+            'barcode': self.barcode or self.product_id,
+            'unit': self.unit or 'pcs'
+        }
+
+_scan_index = None
+_scan_index_built_at = 0
+_scan_index_lock = threading.Lock()
+
+def build_scan_index():
+    """Build code -> ScanRecord map from product IDs, barcodes, QR codes and inventory codes"""
+    index = {}
+    records = {}
+    
+    for row in db.session.query(
+        Product.id, Product.name, Product.barcode, Product.qr_code,
+        Product.selling_price, Product.unit
+    ).filter(Product.is_active == True):
+        record = ScanRecord(row.id, row.name, row.barcode, row.selling_price, row.unit)
+        records[row.id] = record
+        for code in (row.qr_code, row.barcode, row.id):
+            if code:
+                index[code.upper()] = record
+    
+    for code, product_id in db.session.query(InventoryItem.code, InventoryItem.product_id):
+        record = records.get(product_id)
+        if record and code:
+            index.setdefault(code.upper(), record)
+    
+    return index
+
+def get_scan_index():
+    """Return the scan index, rebuilding it when invalidated or expired"""
+    global _scan_index, _scan_index_built_at
+    
+    index = _scan_index
+    if index is not None and time.monotonic() - _scan_index_built_at < SCAN_INDEX_TTL:
+        return index
+    
+    with _scan_index_lock:
+        if _scan_index is None or time.monotonic() - _scan_index_built_at >= SCAN_INDEX_TTL:
+            _scan_index = build_scan_index()
+            _scan_index_built_at = time.monotonic()
+        return _scan_index
+
+def invalidate_scan_index():
+    """Drop the scan index after product or inventory code writes"""
+    global _scan_index
+    _scan_index = None
+
+def lookup_scan_codes(codes):
+    """Resolve scanned codes to products with exact, case-insensitive lookups"""
+    index = get_scan_index()
+    results = []
+    for code in codes:
+        code = str(code).strip()
+        record = index.get(code.upper())
+        results.append({
+            'code': code,
+            'found': record is not None,
+            'item': record.to_dict() if record else None
+        })
+    return results
+
+# Catalog versioning for POS delta sync, maintained by triggers on products
+CATALOG_VERSION_COUNTER = 'catalog_version'
+CATALOG_PRUNED_VERSION_COUNTER = 'catalog_pruned_version'
+CATALOG_DELETION_RETENTION_DAYS = 30
+
+def init_catalog_versioning():
+    """Create the triggers that stamp every product change with a new catalog version"""
+    next_version = "COALESCE((SELECT value FROM counters WHERE name = 'catalog_version'), 0)"
+    bump = "UPDATE counters SET value = value + 1 WHERE name = 'catalog_version';"
+    statements = [
+        "INSERT OR IGNORE INTO counters (name, value) VALUES ('catalog_version', 0)",
+        f"""CREATE TRIGGER IF NOT EXISTS catalog_version_insert AFTER INSERT ON products BEGIN
+            {bump}
+            UPDATE products SET catalog_version = {next_version} WHERE id = new.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS catalog_version_update
+        AFTER UPDATE OF id, name, barcode, qr_code, selling_price, current_stock, unit, is_active ON products BEGIN
+            {bump}
+            UPDATE products SET catalog_version = {next_version} WHERE id = new.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS catalog_version_delete AFTER DELETE ON products BEGIN
+            {bump}
+            INSERT INTO catalog_deletions (product_id, version, deleted_at)
+            VALUES (old.id, {next_version}, CURRENT_TIMESTAMP);
+        END"""
+    ]
+    
+    try:
+        for statement in statements:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+        prune_catalog_deletions()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Catalog versioning note: {e}")
+
+def get_catalog_version():
+    """Current catalog version, 0 when nothing has been versioned yet"""
+    return db.session.query(Counter.value).filter_by(name=CATALOG_VERSION_COUNTER).scalar() or 0
+
+def get_catalog_pruned_version():
+    """Highest catalog version whose delete tombstones have been pruned"""
+    return db.session.query(Counter.value).filter_by(name=CATALOG_PRUNED_VERSION_COUNTER).scalar() or 0
+
+def prune_catalog_deletions(retention_days=CATALOG_DELETION_RETENTION_DAYS):
+    """Drop delete tombstones older than retention_days, returns how many were removed
+    
+    The highest pruned version is kept in the counters table, clients syncing
+    from before it get a full catalog because they may have missed a delete.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    pruned_version = db.session.query(db.func.max(CatalogDeletion.version)).filter(
+        CatalogDeletion.deleted_at < cutoff
+    ).scalar()
+    if pruned_version is None:
+        return 0
+    
+    db.session.execute(db.text(
+        "INSERT INTO counters (name, value) VALUES (:name, :value) "
+        "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)"
+    ), {'name': CATALOG_PRUNED_VERSION_COUNTER, 'value': pruned_version})
+    result = db.session.execute(
+        CatalogDeletion.__table__.delete().where(CatalogDeletion.version <= pruned_version)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def record_daily_sale(timestamp, cashier_id, revenue, profit, items):
+    """Add one sale to the daily_sales rollup, in the caller's transaction"""
+    statement = insert(DailySales.__table__).values(
+        date=timestamp.date(),
+        cashier_id=cashier_id or 0,
+        txn_count=1,
+        revenue=revenue,
+        profit=profit,
+        items=items
+    )
+    excluded = statement.excluded
+    table = DailySales.__table__
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.date, table.c.cashier_id],
+        set_={
+            'txn_count': table.c.txn_count + 1,
+            'revenue': table.c.revenue + excluded.revenue,
+            'profit': table.c.profit + excluded.profit,
+            'items': table.c['items'] + excluded['items']
+        }
+    ))
+
+def rebuild_daily_sales():
+    """Recompute the whole daily_sales rollup from cashier transactions"""
+    db.session.execute(db.text("DELETE FROM daily_sales"))
+    db.session.execute(db.text("""
+        INSERT INTO daily_sales (date, cashier_id, txn_count, revenue, profit, items)
+        SELECT date(t.timestamp), COALESCE(t.cashier_id, 0), COUNT(*),
+               SUM(t.total), SUM(t.profit), COALESCE(SUM(l.quantity), 0)
+        FROM cashier_transactions t
+        LEFT JOIN (
+            SELECT transaction_id, SUM(quantity) AS quantity
+            FROM sale_lines GROUP BY transaction_id
+        ) l ON l.transaction_id = t.id
+        GROUP BY date(t.timestamp), COALESCE(t.cashier_id, 0)
+    """))
+    db.session.commit()
+    return db.session.query(db.func.count()).select_from(DailySales).scalar()
+
+def get_sales_summary(start_date, end_date=None):
+    """Totals of the daily_sales rollup for a date range (inclusive)"""
+    query = db.session.query(
+        db.func.coalesce(db.func.sum(DailySales.txn_count), 0),
+        db.func.coalesce(db.func.sum(DailySales.revenue), 0),
+        db.func.coalesce(db.func.sum(DailySales.profit), 0),
+        db.func.coalesce(db.func.sum(DailySales.items), 0)
+    ).filter(DailySales.date >= start_date)
+    if end_date:
+        query = query.filter(DailySales.date <= end_date)
+    
+    txn_count, revenue, profit, items = query.one()
+    return {'txn_count': txn_count, 'revenue': revenue, 'profit': profit, 'items': items}
+
+# Dashboard statistics, cached briefly because every login lands on the dashboard
+DASHBOARD_STATS_TTL = 30  # seconds a worker may show figures from before the latest sale
+
+_dashboard_stats = None
+_dashboard_stats_built_at = 0
+_dashboard_stats_lock = threading.Lock()
+
+def build_dashboard_stats():
+    """Collect all dashboard figures in a single query"""
+    today = datetime.now().date()
+    
+    def scalar(query):
+        return query.scalar_subquery()
+    
+    row = db.session.query(
+        scalar(db.select(db.func.count()).select_from(Product)).label('total_products'),
+        scalar(db.select(db.func.count()).select_from(InventoryItem)).label('total_inventory_items'),
+        scalar(db.select(db.func.count()).select_from(LowStockWatch)).label('low_stock_items'),
+        scalar(db.select(db.func.count()).select_from(Saver)).label('total_savers'),
+        scalar(db.select(db.func.coalesce(db.func.sum(SavingsTransaction.amount), 0)).where(
+            SavingsTransaction.type == 'deposit'
+        )).label('total_savings'),
+        scalar(db.select(db.func.count()).select_from(Invoice)).label('total_invoices'),
+        scalar(db.select(db.func.count()).select_from(Invoice).where(
+            Invoice.status == 'draft'
+        )).label('pending_invoices'),
+        scalar(db.select(db.func.count()).select_from(CashierTransaction)).label('total_transactions'),
+        scalar(db.select(db.func.coalesce(db.func.sum(DailySales.revenue), 0)).where(
+            DailySales.date == today
+        )).label('today_revenue'),
+        scalar(db.select(db.func.count()).select_from(Customer)).label('total_customers'),
+        scalar(db.select(db.func.coalesce(db.func.sum(CustomerDebt.remaining_amount), 0)).where(
+            CustomerDebt.status == 'active'
+        )).label('total_debts'),
+        scalar(db.select(db.func.count()).select_from(CustomerDebt).where(
+            CustomerDebt.due_date < today, CustomerDebt.status == 'active'
+        )).label('overdue_debts')
+    ).one()
+    
+    return dict(row._mapping)
+
+def get_dashboard_stats():
+    """Return dashboard statistics, rebuilding them when invalidated or expired"""
+    global _dashboard_stats, _dashboard_stats_built_at
+    
+    stats = _dashboard_stats
+    if stats is not None and time.monotonic() - _dashboard_stats_built_at < DASHBOARD_STATS_TTL:
+        return stats
+    
+    with _dashboard_stats_lock:
+        if _dashboard_stats is None or time.monotonic() - _dashboard_stats_built_at >= DASHBOARD_STATS_TTL:
+            _dashboard_stats = build_dashboard_stats()
+            _dashboard_stats_built_at = time.monotonic()
+        return _dashboard_stats
+
+def invalidate_dashboard_stats():
+    """Drop cached dashboard statistics after sales, savings, debt, invoice or stock writes"""
+    global _dashboard_stats
+    _dashboard_stats = None
+
+# Stock ledger: every stock change is appended in the same transaction as the change itself
+STOCK_SNAPSHOT_INTERVAL = timedelta(days=1)
+
+def record_stock_movements(movements, user_id=None, timestamp=None):
+    """Append stock movements, dicts with product_id or inventory_item_id, delta, reason and reference"""
+    rows = [{
+        'product_id': movement.get('product_id'),
+        'inventory_item_id': movement.get('inventory_item_id'),
+        'delta': movement['delta'],
+        'reason': movement['reason'],
+        'reference': movement.get('reference'),
+        'user_id': user_id,
+        'timestamp': timestamp or datetime.now()
+    } for movement in movements if movement['delta']]
+    if rows:
+        db.session.execute(StockMovement.__table__.insert(), rows)
+
+def take_stock_snapshots():
+    """Snapshot the current stock of every product and inventory item, returns the snapshot time"""
+    snapshot_at = datetime.now()
+    params = {'snapshot_at': snapshot_at}
+    last_movement = "(SELECT COALESCE(MAX(id), 0) FROM stock_movements)"
+    db.session.execute(db.text(f"""
+        INSERT INTO stock_snapshots (product_id, inventory_item_id, stock, last_movement_id, snapshot_at)
+        SELECT id, NULL, current_stock, {last_movement}, :snapshot_at FROM products
+    """), params)
+    db.session.execute(db.text(f"""
+        INSERT INTO stock_snapshots (product_id, inventory_item_id, stock, last_movement_id, snapshot_at)
+        SELECT NULL, id, current_stock, {last_movement}, :snapshot_at FROM inventory_items
+    """), params)
+    db.session.commit()
+    return snapshot_at
+
+def get_stock_at(at, product_id=None, inventory_item_id=None):
+    """Stock of a product or inventory item at time `at`: nearest earlier snapshot plus later ledger entries
+    
+    Returns None when `at` is before the ledger has any record of the stock.
+    """
+    if product_id is not None:
+        snapshot_key, movement_key, key = StockSnapshot.product_id, StockMovement.product_id, product_id
+    else:
+        snapshot_key, movement_key, key = StockSnapshot.inventory_item_id, StockMovement.inventory_item_id, inventory_item_id
+    
+    snapshot = StockSnapshot.query.filter(
+        snapshot_key == key, StockSnapshot.snapshot_at <= at
+    ).order_by(StockSnapshot.snapshot_at.desc()).first()
+    
+    movements = db.session.query(
+        db.func.count(StockMovement.id), db.func.coalesce(db.func.sum(StockMovement.delta), 0)
+    ).filter(movement_key == key, StockMovement.timestamp <= at)
+    
+    if snapshot:
+        _, delta = movements.filter(StockMovement.id > snapshot.last_movement_id).one()
+        return snapshot.stock + delta
+    
+    # No snapshot yet: only valid when the ledger holds the whole history (item created after the ledger)
+    if StockSnapshot.query.filter(snapshot_key == key).first() is not None:
+        return None
+    movement_count, delta = movements.one()
+    return delta if movement_count else None
+
+# Low stock watchlist: triggers keep one row per product/item at or below minimum stock
+def init_low_stock_watchlist():
+    """Create the watchlist triggers and flag stock that is already low"""
+    statements = []
+    for table, key in (('products', 'product_id'), ('inventory_items', 'inventory_item_id')):
+        upsert = f"""INSERT INTO low_stock_watchlist ({key}, current_stock, minimum_stock, flagged_at)
+            SELECT new.id, new.current_stock, new.minimum_stock, CURRENT_TIMESTAMP
+            WHERE new.current_stock <= new.minimum_stock
+            ON CONFLICT({key}) DO UPDATE SET
+                current_stock = excluded.current_stock, minimum_stock = excluded.minimum_stock;
+            DELETE FROM low_stock_watchlist WHERE {key} = new.id AND new.current_stock > new.minimum_stock;"""
+        statements += [
+            f"""CREATE TRIGGER IF NOT EXISTS low_stock_{table}_insert AFTER INSERT ON {table} BEGIN
+                {upsert}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS low_stock_{table}_update
+            AFTER UPDATE OF current_stock, minimum_stock ON {table} BEGIN
+                {upsert}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS low_stock_{table}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM low_stock_watchlist WHERE {key} = old.id;
+            END""",
+            f"""INSERT OR IGNORE INTO low_stock_watchlist ({key}, current_stock, minimum_stock, flagged_at)
+            SELECT id, current_stock, minimum_stock, CURRENT_TIMESTAMP FROM {table}
+            WHERE current_stock <= minimum_stock"""
+        ]
+    
+    try:
+        for statement in statements:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Low stock watchlist note: {e}")
+
+def get_low_stock_entries(limit=None):
+    """Watchlist rows with product name, supplier and reorder suggestion, most urgent first"""
+    product_rows = db.session.query(
+        LowStockWatch.product_id, db.literal(None).label('inventory_item_id'), db.literal(None).label('code'),
+        Product.name, Product.supplier, Product.purchase_price, Product.maximum_stock,
+        LowStockWatch.current_stock, LowStockWatch.minimum_stock
+    ).join(Product, Product.id == LowStockWatch.product_id)
+    
+    item_rows = db.session.query(
+        InventoryItem.product_id, LowStockWatch.inventory_item_id, InventoryItem.code,
+        Product.name, Product.supplier, InventoryItem.purchase_price, Product.maximum_stock,
+        LowStockWatch.current_stock, LowStockWatch.minimum_stock
+    ).join(InventoryItem, InventoryItem.id == LowStockWatch.inventory_item_id
+    ).join(Product, Product.id == InventoryItem.product_id)
+    
+    results = []
+    for row in product_rows.all() + item_rows.all():
+        entry = dict(row._mapping)
+        entry['suggested_quantity'] = max((row.maximum_stock or 0) - row.current_stock, row.minimum_stock - row.current_stock, 0)
+        entry['estimated_cost'] = entry['suggested_quantity'] * (row.purchase_price or 0)
+        results.append(entry)
+    
+    # The watchlist only holds low stock, so sorting it here stays small
+    results.sort(key=lambda entry: (entry['current_stock'] - entry['minimum_stock'], entry['name']))
+    return results[:limit] if limit else results
+
+def count_low_stock():
+    """Number of products and inventory items on the low stock watchlist"""
+    return db.session.query(db.func.count(LowStockWatch.id)).scalar()
+
+# Stock take: counts accumulate per session and are applied in one transaction
+def resolve_stock_take_codes(codes):
+    """Map scanned codes to ('inventory_item_id', id) or ('product_id', id), inventory codes first"""
+    variants = {variant for code in codes for variant in (code, code.upper())}
+    if not variants:
+        return {}
+    
+    targets = {}
+    for product_id, barcode, qr_code in db.session.query(Product.id, Product.barcode, Product.qr_code).filter(db.or_(
+        Product.id.in_(variants), Product.barcode.in_(variants), Product.qr_code.in_(variants)
+    )):
+        for code in (qr_code, barcode, product_id):
+            if code:
+                targets[code.upper()] = ('product_id', product_id)
+    for item_id, code in db.session.query(InventoryItem.id, InventoryItem.code).filter(InventoryItem.code.in_(variants)):
+        targets[code.upper()] = ('inventory_item_id', item_id)
+    return targets
+
+def record_stock_take_counts(stock_take_id, scans, replace=False):
+    """Add (or with replace, set) scanned quantities, scans are (code, quantity) pairs
+    
+    Returns one result per scan with the running count of its product or item.
+    """
+    scans = [(str(code).strip(), quantity) for code, quantity in scans]
+    targets = resolve_stock_take_codes([code for code, _ in scans])
+    
+    # Repeated scans of one target in a burst become a single upsert
+    totals = OrderedDict()
+    for code, quantity in scans:
+        target = targets.get(code.upper())
+        if target:
+            totals[target] = quantity if replace else totals.get(target, 0) + quantity
+    
+    table = StockTakeCount.__table__
+    counted = {}
+    now = datetime.now()
+    for (key, target_id), quantity in totals.items():
+        statement = insert(table).values(stock_take_id=stock_take_id, counted=quantity, updated_at=now, **{key: target_id})
+        new_count = statement.excluded.counted if replace else table.c.counted + statement.excluded.counted
+        counted[(key, target_id)] = db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.stock_take_id, table.c[key]],
+            set_={'counted': new_count, 'updated_at': now}
+        ).returning(table.c.counted)).scalar()
+    db.session.commit()
+    
+    results = []
+    for code, quantity in scans:
+        target = targets.get(code.upper())
+        result = {'code': code, 'found': target is not None, 'counted': counted.get(target)}
+        if target:
+            result[target[0]] = target[1]
+        results.append(result)
+    return results
+
+def get_stock_take_variances(stock_take_id):
+    """Counted versus system stock for every counted product and item, largest value difference first"""
+    counts = StockTakeCount.__table__.c
+    product_rows = db.session.query(
+        counts.product_id, db.literal(None).label('inventory_item_id'), Product.id.label('code'), Product.name,
+        Product.current_stock.label('system_stock'), counts.counted, counts.expected, Product.purchase_price
+    ).join(Product, Product.id == counts.product_id).filter(counts.stock_take_id == stock_take_id)
+    
+    item_rows = db.session.query(
+        InventoryItem.product_id, counts.inventory_item_id, InventoryItem.code, Product.name,
+        InventoryItem.current_stock.label('system_stock'), counts.counted, counts.expected, InventoryItem.purchase_price
+    ).join(InventoryItem, InventoryItem.id == counts.inventory_item_id
+    ).join(Product, Product.id == InventoryItem.product_id).filter(counts.stock_take_id == stock_take_id)
+    
+    variances = []
+    for row in product_rows.all() + item_rows.all():
+        entry = dict(row._mapping)
+        # Applied sessions compare against the stock recorded at apply time
+        if row.expected is not None:
+            entry['system_stock'] = row.expected
+        entry['variance'] = row.counted - entry['system_stock']
+        entry['variance_value'] = entry['variance'] * (row.purchase_price or 0)
+        variances.append(entry)
+    
+    variances.sort(key=lambda entry: (-abs(entry['variance_value']), -abs(entry['variance']), entry['name']))
+    return variances
+
+def apply_stock_take(stock_take, user_id=None):
+    """Set counted stock on every product and item, with ledger entries, in one transaction
+    
+    Returns the number of adjusted products and items.
+    """
+    params = {
+        'stock_take_id': stock_take.id,
+        'reference': f'stock_take:{stock_take.id}',
+        'user_id': user_id,
+        'now': datetime.now(),
+        'updated_at': datetime.utcnow()
+    }
+    counted_rows = "SELECT {key} FROM stock_take_counts WHERE stock_take_id = :stock_take_id AND counted != expected"
+    counted_value = "SELECT counted FROM stock_take_counts WHERE stock_take_id = :stock_take_id AND {key} = {table}.id"
+    
+    # Recording the system stock is the first write, which locks out other writers until commit
+    for table, key in (('products', 'product_id'), ('inventory_items', 'inventory_item_id')):
+        db.session.execute(db.text(f"""
+            UPDATE stock_take_counts SET expected = (SELECT current_stock FROM {table} WHERE id = stock_take_counts.{key})
+            WHERE stock_take_id = :stock_take_id AND {key} IS NOT NULL
+        """), params)
+    
+    adjusted = db.session.execute(db.text("""
+        INSERT INTO stock_movements (product_id, inventory_item_id, delta, reason, reference, user_id, timestamp)
+        SELECT product_id, inventory_item_id, counted - expected, 'stock_take', :reference, :user_id, :now
+        FROM stock_take_counts WHERE stock_take_id = :stock_take_id AND counted != expected
+    """), params).rowcount
+    
+    db.session.execute(db.text(f"""
+        UPDATE products SET current_stock = ({counted_value.format(key='product_id', table='products')}), updated_at = :updated_at
+        WHERE id IN ({counted_rows.format(key='product_id')})
+    """), params)
+    db.session.execute(db.text(f"""
+        UPDATE inventory_items SET current_stock = ({counted_value.format(key='inventory_item_id', table='inventory_items')})
+        WHERE id IN ({counted_rows.format(key='inventory_item_id')})
+    """), params)
+    
+    stock_take.status = 'applied'
+    stock_take.applied_at = params['now']
+    db.session.commit()
+    return adjusted
+
+# Savings balances, stored on the saver row and moved together with each transaction
+class SavingsError(Exception):
+    """Raised when a savings transaction cannot be applied"""
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+def apply_savings_transaction(saver, amount, transaction_type, entry_date, description):
+    """Update the saver balance and add the transaction, in the caller's transaction
+    
+    The balance moves with one UPDATE ... RETURNING, and a withdrawal only applies
+    while the balance still covers it, so concurrent counters cannot overdraw.
+    Returns the new SavingsTransaction or raises SavingsError.
+    """
+    if amount <= 0:
+        raise SavingsError('Jumlah harus lebih dari 0!')
+    
+    change = amount if transaction_type == 'deposit' else -amount
+    statement = db.update(Saver).where(Saver.id == saver.id).values(balance=Saver.balance + change)
+    if transaction_type == 'withdrawal':
+        statement = statement.where(Saver.balance >= amount)
+    new_balance = db.session.execute(
+        statement.returning(Saver.balance), execution_options={'synchronize_session': False}
+    ).scalar()
+    if new_balance is None:
+        raise SavingsError('Saldo tidak mencukupi!')
+    set_committed_value(saver, 'balance', new_balance)
+    
+    transaction = SavingsTransaction(
+        saver_id=saver.id,
+        date=entry_date,
+        amount=amount,
+        type=transaction_type,
+        description=description,
+        balance_after=new_balance
+    )
+    db.session.add(transaction)
+    return transaction
+
+def _signed_savings_amount():
+    return db.case(
+        (SavingsTransaction.type == 'deposit', SavingsTransaction.amount),
+        (SavingsTransaction.type == 'withdrawal', -SavingsTransaction.amount),
+        else_=0
+    )
+
+def find_saver_balance_mismatches():
+    """Savers whose stored balance differs from the sum of their transactions"""
+    totals = db.select(
+        SavingsTransaction.saver_id, db.func.sum(_signed_savings_amount()).label('computed')
+    ).group_by(SavingsTransaction.saver_id).subquery()
+    computed = db.func.coalesce(totals.c.computed, 0)
+    
+    return db.session.query(Saver.id, Saver.name, Saver.balance, computed.label('computed')).outerjoin(
+        totals, totals.c.saver_id == Saver.id
+    ).filter(db.func.abs(Saver.balance - computed) > 0.005).order_by(Saver.name).all()
+
+def rebuild_saver_balances():
+    """Recompute every stored saver balance from the transaction history"""
+    result = db.session.execute(db.update(Saver).values(balance=db.func.coalesce(
+        db.select(db.func.sum(_signed_savings_amount()))
+        .where(SavingsTransaction.saver_id == Saver.id).scalar_subquery(),
+        0
+    )), execution_options={'synchronize_session': False})
+    db.session.commit()
+    return result.rowcount
+
+# Savings statements, bounded by a date range and paginated
+STATEMENT_DEFAULT_DAYS = 90
+STATEMENT_PAGE_SIZE = 50
+STATEMENT_PDF_CHUNK_ROWS = 500
+
+def parse_statement_period(args):
+    """(start_date, end_date) from request args, by default the last STATEMENT_DEFAULT_DAYS days"""
+    end_date = datetime.strptime(args['end_date'], '%Y-%m-%d').date() if args.get('end_date') else datetime.now().date()
+    if args.get('start_date'):
+        start_date = datetime.strptime(args['start_date'], '%Y-%m-%d').date()
+    else:
+        start_date = end_date - timedelta(days=STATEMENT_DEFAULT_DAYS - 1)
+    if start_date > end_date:
+        raise ValueError('start_date is after end_date')
+    return start_date, end_date
+
+def get_saver_balance_at(saver_id, before_date):
+    """Balance of a saver at the start of before_date: latest month-end snapshot plus later transactions"""
+    snapshot = db.session.query(SaverBalanceSnapshot.month_end, SaverBalanceSnapshot.balance).filter(
+        SaverBalanceSnapshot.saver_id == saver_id,
+        SaverBalanceSnapshot.month_end < before_date
+    ).order_by(SaverBalanceSnapshot.month_end.desc()).first()
+    
+    delta = db.session.query(db.func.coalesce(db.func.sum(_signed_savings_amount()), 0)).filter(
+        SavingsTransaction.saver_id == saver_id,
+        SavingsTransaction.date < before_date
+    )
+    if snapshot is None:
+        return delta.scalar()
+    return snapshot.balance + delta.filter(SavingsTransaction.date > snapshot.month_end).scalar()
+
+def _statement_filter(saver_id, start_date, end_date):
+    return db.and_(
+        SavingsTransaction.saver_id == saver_id,
+        SavingsTransaction.date >= start_date,
+        SavingsTransaction.date <= end_date
+    )
+
+def get_savings_statement(saver, start_date, end_date, page=1, per_page=STATEMENT_PAGE_SIZE):
+    """One page of a saver's statement for start_date..end_date, oldest first, with running balances"""
+    in_range = _statement_filter(saver.id, start_date, end_date)
+    ordering = (SavingsTransaction.date, SavingsTransaction.id)
+    
+    count, deposits, withdrawals = db.session.query(
+        db.func.count(SavingsTransaction.id),
+        db.func.coalesce(db.func.sum(db.case((SavingsTransaction.type == 'deposit', SavingsTransaction.amount), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((SavingsTransaction.type == 'withdrawal', SavingsTransaction.amount), else_=0)), 0)
+    ).filter(in_range).one()
+    opening_balance = get_saver_balance_at(saver.id, start_date)
+    
+    pages = max((count + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), pages)
+    offset = (page - 1) * per_page
+    
+    # Running balances on later pages continue from the rows of the earlier pages
+    balance = opening_balance
+    if offset:
+        earlier = db.select(_signed_savings_amount().label('amount')).where(in_range).order_by(*ordering).limit(offset).subquery()
+        balance += db.session.query(db.func.coalesce(db.func.sum(earlier.c.amount), 0)).scalar()
+    
+    entries = []
+    for transaction in SavingsTransaction.query.filter(in_range).order_by(*ordering).offset(offset).limit(per_page):
+        balance += transaction.amount if transaction.type == 'deposit' else -transaction.amount
+        entries.append((transaction, balance))
+    
+    return {
+        'entries': entries,
+        'opening_balance': opening_balance,
+        'closing_balance': opening_balance + deposits - withdrawals,
+        'total_deposits': deposits,
+        'total_withdrawals': withdrawals,
+        'transaction_count': count,
+        'page': page,
+        'pages': pages
+    }
+
+# Month-end saver balance snapshots: built by a batch job, shifted by triggers for back-dated changes
+SIGNED_SAVINGS_AMOUNT_SQL = "CASE {row}.type WHEN 'deposit' THEN {row}.amount WHEN 'withdrawal' THEN -{row}.amount ELSE 0 END"
+
+def build_saver_balance_snapshots():
+    """Rebuild month-end balances of every saver for completed months with transactions"""
+    current_month_start = datetime.now().date().replace(day=1)
+    db.session.execute(db.text("DELETE FROM saver_balance_snapshots"))
+    db.session.execute(db.text(f"""
+        INSERT INTO saver_balance_snapshots (saver_id, month_end, balance, created_at)
+        SELECT saver_id, month_end, SUM(net) OVER (PARTITION BY saver_id ORDER BY month_end), :now
+        FROM (
+            SELECT t.saver_id, date(t.date, 'start of month', '+1 month', '-1 day') AS month_end,
+                   SUM({SIGNED_SAVINGS_AMOUNT_SQL.format(row='t')}) AS net
+            FROM savings_transactions t
+            WHERE t.date < :current_month_start
+            GROUP BY t.saver_id, month_end
+        )
+    """), {'now': datetime.now(), 'current_month_start': current_month_start})
+    db.session.commit()
+    return db.session.query(db.func.count()).select_from(SaverBalanceSnapshot).scalar()
+
+def init_saver_balance_snapshots():
+    """Create the triggers that keep snapshots correct when transactions change in past months"""
+    shift = "UPDATE saver_balance_snapshots SET balance = balance {sign} ({amount}) WHERE saver_id = {row}.saver_id AND month_end >= {row}.date;"
+    add_new = shift.format(sign='+', amount=SIGNED_SAVINGS_AMOUNT_SQL.format(row='new'), row='new')
+    remove_old = shift.format(sign='-', amount=SIGNED_SAVINGS_AMOUNT_SQL.format(row='old'), row='old')
+    statements = [
+        f"""CREATE TRIGGER IF NOT EXISTS saver_snapshots_insert AFTER INSERT ON savings_transactions BEGIN
+            {add_new}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS saver_snapshots_update
+        AFTER UPDATE OF saver_id, date, amount, type ON savings_transactions BEGIN
+            {remove_old}
+            {add_new}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS saver_snapshots_delete AFTER DELETE ON savings_transactions BEGIN
+            {remove_old}
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS saver_snapshots_saver_delete AFTER DELETE ON savers BEGIN
+            DELETE FROM saver_balance_snapshots WHERE saver_id = old.id;
+        END"""
+    ]
+    
+    try:
+        for statement in statements:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+        
+        if SaverBalanceSnapshot.query.first() is None and SavingsTransaction.query.first() is not None:
+            print(f"Built {build_saver_balance_snapshots()} saver balance snapshots")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Saver balance snapshot note: {e}")
+
+# Savings dashboard, keyset-paginated by saver name
+SAVERS_PAGE_SIZE = 50
+
+def get_saver_page(args):
+    """Return (rows, next_cursor), rows are (saver, transaction_count, last_transaction_date)
+    
+    The page of savers is picked first, so the grouped join only touches the
+    transactions of the savers on the page. Search is a case-insensitive prefix
+    match on name or phone, which the NOCASE and phone indexes can serve.
+    """
+    limit = min(max(args.get('limit', SAVERS_PAGE_SIZE, type=int), 1), PRODUCT_LIST_MAX_PAGE_SIZE)
+    
+    page = db.select(Saver.id)
+    search = args.get('search', '').strip()
+    if search:
+        upper_bound = search + '\U0010FFFF'
+        page = page.where(db.or_(
+            db.and_(Saver.name.collate('NOCASE') >= search, Saver.name.collate('NOCASE') < upper_bound),
+            db.and_(Saver.phone >= search, Saver.phone < upper_bound)
+        ))
+    if args.get('after'):
+        page = page.where(Saver.name > args['after'])
+    page = page.order_by(Saver.name).limit(limit + 1).subquery()
+    
+    rows = db.session.query(
+        Saver, db.func.count(SavingsTransaction.id), db.func.max(SavingsTransaction.date)
+    ).join(page, page.c.id == Saver.id).outerjoin(
+        SavingsTransaction, SavingsTransaction.saver_id == Saver.id
+    ).group_by(Saver.id).order_by(Saver.name).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0].name
+    return rows, next_cursor
+
+def get_savings_summary():
+    """Saver count, stored balance total and deposit/withdrawal totals, in one query"""
+    row = db.session.query(
+        db.select(db.func.count()).select_from(Saver).scalar_subquery().label('total_savers'),
+        db.select(db.func.coalesce(db.func.sum(Saver.balance), 0)).scalar_subquery().label('total_balance'),
+        db.select(db.func.coalesce(db.func.sum(SavingsTransaction.amount), 0)).where(
+            SavingsTransaction.type == 'deposit'
+        ).scalar_subquery().label('total_deposits'),
+        db.select(db.func.coalesce(db.func.sum(SavingsTransaction.amount), 0)).where(
+            SavingsTransaction.type == 'withdrawal'
+        ).scalar_subquery().label('total_withdrawals')
+    ).one()
+    return dict(row._mapping)
+
+# Sales forecasting, vectorized over all products with NumPy (optional dependency)
+FORECAST_WINDOW_DAYS = 365
+FORECAST_SMOOTHING_ALPHA = 0.15
+FORECAST_LEAD_TIME_DAYS = 7
+FORECAST_SERVICE_LEVEL_Z = 1.65  # ~95% service level for the safety stock
+FORECAST_ABC_THRESHOLDS = (0.80, 0.95)  # cumulative revenue share of class A and B
+
+def compute_product_forecasts(window_days=FORECAST_WINDOW_DAYS):
+    """Recompute product_forecasts for every product from daily sale line totals
+    
+    Daily quantities are loaded into a products x days array, and all statistics
+    are computed for every product at once. Returns the number of products, or
+    None when NumPy is not installed.
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    
+    start_date = datetime.now().date() - timedelta(days=window_days - 1)
+    
+    products = db.session.execute(db.select(Product.id, Product.current_stock).order_by(Product.id)).all()
+    if not products:
+        return 0
+    product_index = {product_id: position for position, (product_id, _) in enumerate(products)}
+    current_stock = np.array([stock or 0 for _, stock in products], dtype=float)
+    
+    quantities = np.zeros((len(products), window_days))
+    revenue = np.zeros(len(products))
+    
+    # Map transactions to day offsets once, then scatter the sale lines without a per-line join
+    transactions = db.session.execute(
+        db.select(CashierTransaction.id, CashierTransaction.timestamp)
+        .where(CashierTransaction.timestamp >= datetime.combine(start_date, datetime.min.time()))
+        .order_by(CashierTransaction.id)
+    ).all()
+    if transactions:
+        transaction_ids = np.array([transaction_id for transaction_id, _ in transactions])
+        transaction_days = np.minimum([(timestamp.date() - start_date).days for _, timestamp in transactions], window_days - 1)
+        
+        lines = db.session.execute(
+            db.select(SaleLine.transaction_id, SaleLine.product_id, SaleLine.quantity, SaleLine.subtotal)
+            .where(SaleLine.transaction_id >= int(transaction_ids[0]))
+        ).all()
+        if lines:
+            line_transactions, line_products, line_quantities, line_subtotals = zip(*lines)
+            line_transactions = np.array(line_transactions)
+            slots = np.minimum(np.searchsorted(transaction_ids, line_transactions), len(transaction_ids) - 1)
+            positions = np.array([product_index.get(product_id, -1) for product_id in line_products])
+            known = (transaction_ids[slots] == line_transactions) & (positions >= 0)
+            np.add.at(quantities, (positions[known], transaction_days[slots[known]]),
+                      np.array(line_quantities, dtype=float)[known])
+            np.add.at(revenue, positions[known], np.array(line_subtotals, dtype=float)[known])
+    
+    avg_daily_7 = quantities[:, -7:].mean(axis=1)
+    avg_daily_30 = quantities[:, -30:].mean(axis=1)
+    
+    # Exponential smoothing s_t = a*x_t + (1-a)*s_(t-1), s_0 = x_0, as one weighted sum per product
+    alpha = FORECAST_SMOOTHING_ALPHA
+    weights = alpha * (1 - alpha) ** np.arange(window_days - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (window_days - 1)
+    smoothed_daily = quantities @ weights
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_until_stockout = np.where(smoothed_daily > 0, current_stock / smoothed_daily, np.nan)
+    
+    safety_stock = FORECAST_SERVICE_LEVEL_Z * quantities[:, -30:].std(axis=1) * np.sqrt(FORECAST_LEAD_TIME_DAYS)
+    reorder_point = np.ceil(smoothed_daily * FORECAST_LEAD_TIME_DAYS + safety_stock).astype(int)
+    
+    # ABC classes by cumulative share of revenue; the top seller is always A, non-sellers always C
+    order = np.argsort(-revenue, kind='stable')
+    total_revenue = revenue.sum()
+    ranked_revenue = revenue[order]
+    ranked_classes = np.full(len(products), 'C')
+    if total_revenue > 0:
+        share_before = (np.cumsum(ranked_revenue) - ranked_revenue) / total_revenue
+        ranked_classes = np.where(share_before < FORECAST_ABC_THRESHOLDS[0], 'A',
+                                  np.where(share_before < FORECAST_ABC_THRESHOLDS[1], 'B', 'C'))
+        ranked_classes[ranked_revenue <= 0] = 'C'
+    abc_classes = np.empty(len(products), dtype='<U1')
+    abc_classes[order] = ranked_classes
+    
+    computed_at = datetime.now()
+    rows = [{
+        'product_id': product_id,
+        'avg_daily_7': float(avg_daily_7[position]),
+        'avg_daily_30': float(avg_daily_30[position]),
+        'smoothed_daily': float(smoothed_daily[position]),
+        'days_until_stockout': None if np.isnan(days_until_stockout[position]) else float(days_until_stockout[position]),
+        'reorder_point': int(reorder_point[position]),
+        'revenue': float(revenue[position]),
+        'abc_class': str(abc_classes[position]),
+        'computed_at': computed_at
+    } for position, (product_id, _) in enumerate(products)]
+    
+    db.session.execute(ProductForecast.__table__.delete())
+    db.session.execute(ProductForecast.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+class SaleError(Exception):
+    """Raised when a sale cannot be applied, with the cart lines that failed"""
+    def __init__(self, message, failed_items=None):
+        super().__init__(message)
+        self.message = message
+        self.failed_items = failed_items or []
+
+def _find_failed_sale_lines(quantities, stock_rows):
+    """Compare requested quantities against product rows and list failing lines"""
+    failed_items = []
+    for product_id, quantity in quantities.items():
+        row = stock_rows.get(product_id)
+        if row is None:
+            failed_items.append({'id': product_id, 'name': None, 'quantity': quantity,
+                                 'available': 0, 'reason': 'not_found'})
+        elif row.current_stock < quantity:
+            failed_items.append({'id': product_id, 'name': row.name, 'quantity': quantity,
+                                 'available': row.current_stock, 'reason': 'insufficient_stock'})
+    return failed_items
+
+def _sale_error_message(failed_items):
+    names = [item['name'] or 'produk tidak ditemukan' for item in failed_items]
+    return f"Stok tidak mencukupi untuk {', '.join(names)}!"
+
+def apply_sale(cart_items, payment_amount, cashier_id, item_format='pos', timestamp=None):
+    """Apply a sale: load the cart in one query and decrement stock atomically
+    
+    Stock is decremented by a single conditional UPDATE that only applies when
+    every line still has enough stock, so concurrent terminals can never push
+    stock below zero. The caller is responsible for committing.
+    Returns (transaction, transaction_items) or raises SaleError.
+    """
+    if not cart_items:
+        raise SaleError('Keranjang kosong!')
+    
+    # Merge cart lines per product, handle both 'kode' and 'id' format
+    quantities = {}
+    for cart_item in cart_items:
+        product_id = cart_item.get('kode') or cart_item.get('id')
+        try:
+            quantity = int(cart_item.get('quantity', 0))
+        except (ValueError, TypeError):
+            quantity = 0
+        if not product_id or quantity <= 0:
+            raise SaleError('Jumlah item tidak valid!', [{
+                'id': product_id, 'name': None, 'quantity': cart_item.get('quantity'),
+                'available': None, 'reason': 'invalid_quantity'
+            }])
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    
+    products = {
+        row.id: row for row in db.session.query(
+            Product.id, Product.name, Product.selling_price,
+            Product.purchase_price, Product.current_stock
+        ).filter(Product.id.in_(list(quantities))).all()
+    }
+    
+    failed_items = _find_failed_sale_lines(quantities, products)
+    if failed_items:
+        raise SaleError(_sale_error_message(failed_items), failed_items)
+    
+    transaction_items = []
+    sale_lines = []
+    total_amount = 0
+    total_profit = 0
+    
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        subtotal = product.selling_price * quantity
+        total_amount += subtotal
+        total_profit += (product.selling_price - product.purchase_price) * quantity
+        
+        sale_lines.append(SaleLine(
+            product_id=product.id,
+            product_name=product.name,
+            quantity=quantity,
+            unit_price=product.selling_price,
+            unit_cost=product.purchase_price,
+            subtotal=subtotal
+        ))
+        
+        if item_format == 'cashier':
+            transaction_items.append({
+                'kode': product.id,
+                'nama': product.name,
+                'harga_jual': product.selling_price,
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+        else:
+            transaction_items.append({
+                'id': product.id,
+                'name': product.name,
+                'selling_price': product.selling_price,
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+    
+    if payment_amount < total_amount:
+        raise SaleError('Jumlah pembayaran kurang!')
+    
+    # Decrement all lines in one statement, only if every line has enough stock
+    products_table = Product.__table__
+    guard = products_table.alias('guard')
+    product_ids = list(quantities)
+    quantity_case = db.case(quantities, value=products_table.c.id)
+    new_stock = products_table.c.current_stock - quantity_case
+    items_sold = products_table.c.initial_stock - new_stock
+    
+    short_lines = db.select(guard.c.id).where(
+        guard.c.id.in_(product_ids),
+        guard.c.current_stock < db.case(quantities, value=guard.c.id)
+    )
+    
+    result = db.session.execute(
+        products_table.update().where(
+            products_table.c.id.in_(product_ids),
+            products_table.c.current_stock >= quantity_case,
+            ~db.exists(short_lines)
+        ).values(
+            current_stock=new_stock,
+            total_sold=products_table.c.total_sold + quantity_case,
+            total_revenue=products_table.c.total_revenue + products_table.c.selling_price * quantity_case,
+            profit=db.case(
+                (items_sold > 0, (products_table.c.selling_price - products_table.c.purchase_price) * items_sold),
+                else_=0
+            )
+        )
+    )
+    
+    if result.rowcount != len(product_ids):
+        # Another terminal sold the stock first, report the lines that are now short
+        stock_rows = {
+            row.id: row for row in db.session.query(Product.id, Product.name, Product.current_stock)
+            .filter(Product.id.in_(product_ids)).all()
+        }
+        failed_items = _find_failed_sale_lines(quantities, stock_rows)
+        raise SaleError(_sale_error_message(failed_items), failed_items)
+    
+    transaction = CashierTransaction(
+        timestamp=timestamp or datetime.now(),
+        items=json.dumps(transaction_items),
+        total=total_amount,
+        profit=total_profit,
+        payment_amount=payment_amount,
+        change_amount=payment_amount - total_amount,
+        cashier_id=cashier_id,
+        lines=sale_lines
+    )
+    db.session.add(transaction)
+    db.session.flush()
+    record_daily_sale(transaction.timestamp, cashier_id, total_amount, total_profit, sum(quantities.values()))
+    record_stock_movements([
+        {'product_id': product_id, 'delta': -quantity, 'reason': 'sale', 'reference': f'sale:{transaction.id}'}
+        for product_id, quantity in quantities.items()
+    ], user_id=cashier_id, timestamp=transaction.timestamp)
+    
+    return transaction, transaction_items
+
 def login_required(f):
     """Decorator to require login"""
     from functools import wraps
@@ -484,76 +1805,52 @@ def cashier_access(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# PDF Generation Functions
-def generate_receipt_pdf(transaction):
-    """Generate receipt PDF for transaction - Real store receipt style"""
-    if not REPORTLAB_AVAILABLE:
-        return None
-    
-    buffer = io.BytesIO()
-    # Use smaller page size to mimic real thermal printer receipt
-    from reportlab.lib.pagesizes import A5
-    doc = SimpleDocTemplate(buffer, pagesize=(200, 800), topMargin=10, bottomMargin=10, leftMargin=10, rightMargin=10)
-    styles = getSampleStyleSheet()
-    
-    # Create custom styles for receipt
-    receipt_style = ParagraphStyle(
-        'Receipt',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=1,  # Center alignment
-        fontName='Courier'
-    )
-    
-    receipt_bold = ParagraphStyle(
-        'ReceiptBold',
-        parent=receipt_style,
-        fontName='Courier-Bold',
-        fontSize=9
-    )
-    
-    receipt_small = ParagraphStyle(
-        'ReceiptSmall',
-        parent=receipt_style,
-        fontSize=7
-    )
+# Receipt layout shared by the PDF and ESC/POS renderers.
+# Each line is a (style, text) tuple, style is 'bold', 'normal', 'small' or
+# 'rule' (text is the character repeated across the receipt width).
+# Same width as '%d/%m/%Y %H:%M', so the time can be stamped into a cached PDF in place
+RECEIPT_PRINTED_AT_PLACEHOLDER = 'DD/MM/YYYY HH:MM'
+
+def build_sale_receipt_lines(transaction, printed_at=None):
+    """Layout of a POS sale receipt - Real store receipt style
     
-    elements = []
+    Without printed_at the "Dicetak" line carries RECEIPT_PRINTED_AT_PLACEHOLDER,
+    which stamp_receipt_printed_at fills in when the cached PDF is served.
+    """
+    lines = []
     
     # Business header - Real store style
     business = BusinessSettings.query.first()
     if business:
-        elements.append(Paragraph(business.business_name.upper(), receipt_bold))
+        lines.append(('bold', business.business_name.upper()))
         if business.address:
             # Split long address into multiple lines for receipt format
             address_lines = business.address.split(',')
             for line in address_lines[:3]:  # Limit to 3 lines for receipt
-                elements.append(Paragraph(line.strip(), receipt_small))
+                lines.append(('small', line.strip()))
         if business.phone:
-            elements.append(Paragraph(f"Telp: {business.phone}", receipt_small))
+            lines.append(('small', f"Telp: {business.phone}"))
         if business.website:
-            elements.append(Paragraph(business.website, receipt_small))
+            lines.append(('small', business.website))
     else:
-        elements.append(Paragraph("FAJAR MANDIRI FOTOCOPY", receipt_bold))
-        elements.append(Paragraph("KP Jl. Pasir Wangi, RT.01/RW.11", receipt_small))
-        elements.append(Paragraph("Gudangkahuripan, Kec. Lembang", receipt_small))
-        elements.append(Paragraph("Kab. Bandung Barat, Jawa Barat 40391", receipt_small))
-        elements.append(Paragraph("Telp: (+62) 81804411937", receipt_small))
-    
-    # Separator line
-    elements.append(Paragraph("=" * 40, receipt_small))
+        lines.append(('bold', "FAJAR MANDIRI FOTOCOPY"))
+        lines.append(('small', "KP Jl. Pasir Wangi, RT.01/RW.11"))
+        lines.append(('small', "Gudangkahuripan, Kec. Lembang"))
+        lines.append(('small', "Kab. Bandung Barat, Jawa Barat 40391"))
+        lines.append(('small', "Telp: (+62) 81804411937"))
     
     # Transaction details
-    elements.append(Paragraph(f"STRUK BELANJA", receipt_bold))
-    elements.append(Paragraph("=" * 40, receipt_small))
+    lines.append(('rule', '='))
+    lines.append(('bold', "STRUK BELANJA"))
+    lines.append(('rule', '='))
     
     # Transaction info in real receipt format
-    elements.append(Paragraph(f"No.Ref   : {str(transaction.id).zfill(6)}", receipt_small))
-    elements.append(Paragraph(f"Tanggal  : {transaction.timestamp.strftime('%d/%m/%Y')}", receipt_small))
-    elements.append(Paragraph(f"Waktu    : {transaction.timestamp.strftime('%H:%M:%S')}", receipt_small))
+    lines.append(('small', f"No.Ref   : {str(transaction.id).zfill(6)}"))
+    lines.append(('small', f"Tanggal  : {transaction.timestamp.strftime('%d/%m/%Y')}"))
+    lines.append(('small', f"Waktu    : {transaction.timestamp.strftime('%H:%M:%S')}"))
     cashier_name = User.query.get(transaction.cashier_id).username if transaction.cashier_id else 'KASIR01'
-    elements.append(Paragraph(f"Kasir    : {cashier_name.upper()}", receipt_small))
-    elements.append(Paragraph("-" * 40, receipt_small))
+    lines.append(('small', f"Kasir    : {cashier_name.upper()}"))
+    lines.append(('rule', '-'))
     
     # Items in thermal receipt format
     items = json.loads(transaction.items)
@@ -561,50 +1858,201 @@ def generate_receipt_pdf(transaction):
     for i, item in enumerate(items, 1):
         # Item name - handle both 'name' and 'nama' keys
         item_name = (item.get('name') or item.get('nama') or 'Item tidak diketahui')[:25]
-        elements.append(Paragraph(f"{i:2d}. {item_name}", receipt_small))
+        lines.append(('small', f"{i:2d}. {item_name}"))
         
         # Price details in one line - handle both key formats
         qty = item['quantity']
         price = item.get('selling_price') or item.get('harga_jual', 0)
         subtotal = item['subtotal']
         
-        price_line = f"    {qty} x {format_currency(price).replace('Rp ', '')} = {format_currency(subtotal).replace('Rp ', '')}"
-        elements.append(Paragraph(price_line, receipt_small))
+        lines.append(('small', f"    {qty} x {format_currency(price).replace('Rp ', '')} = {format_currency(subtotal).replace('Rp ', '')}"))
     
     # Summary section
-    elements.append(Paragraph("-" * 40, receipt_small))
-    
-    # Total in big font
-    total_line = f"TOTAL: {format_currency(transaction.total)}"
-    elements.append(Paragraph(total_line, receipt_bold))
-    
-    # Payment details
-    elements.append(Paragraph(f"TUNAI: {format_currency(transaction.payment_amount)}", receipt_small))
-    elements.append(Paragraph(f"KEMBALI: {format_currency(transaction.change_amount)}", receipt_small))
-    
-    elements.append(Paragraph("=" * 40, receipt_small))
+    lines.append(('rule', '-'))
+    lines.append(('bold', f"TOTAL: {format_currency(transaction.total)}"))
+    lines.append(('small', f"TUNAI: {format_currency(transaction.payment_amount)}"))
+    lines.append(('small', f"KEMBALI: {format_currency(transaction.change_amount)}"))
+    lines.append(('rule', '='))
     
     # Footer - Real store style
-    elements.append(Paragraph("*** TERIMA KASIH ***", receipt_bold))
-    elements.append(Paragraph("SELAMAT BERBELANJA KEMBALI", receipt_small))
-    elements.append(Paragraph("Barang yang sudah dibeli", receipt_small))
-    elements.append(Paragraph("tidak dapat dikembalikan", receipt_small))
-    elements.append(Paragraph("kecuali ada kesepakatan", receipt_small))
+    lines.append(('bold', "*** TERIMA KASIH ***"))
+    lines.append(('small', "SELAMAT BERBELANJA KEMBALI"))
+    lines.append(('small', "Barang yang sudah dibeli"))
+    lines.append(('small', "tidak dapat dikembalikan"))
+    lines.append(('small', "kecuali ada kesepakatan"))
     
     # Business footer
     if business and business.copyright_text:
-        elements.append(Paragraph("-" * 40, receipt_small))
-        elements.append(Paragraph(business.copyright_text, receipt_small))
+        lines.append(('rule', '-'))
+        lines.append(('small', business.copyright_text))
     
     # Print timestamp
-    elements.append(Paragraph(f"Dicetak: {datetime.now().strftime('%d/%m/%Y %H:%M')}", receipt_small))
+    printed = printed_at.strftime('%d/%m/%Y %H:%M') if printed_at else RECEIPT_PRINTED_AT_PLACEHOLDER
+    lines.append(('small', f"Dicetak: {printed}"))
+    return lines
+
+def build_savings_receipt_lines(transaction):
+    """Layout of a savings transaction receipt - ATM/Bank receipt style"""
+    lines = []
+    
+    # Bank header
+    business = BusinessSettings.query.first()
+    if business:
+        lines.append(('bold', business.business_name.upper()))
+        lines.append(('normal', "LAYANAN TABUNGAN"))
+        
+        if business.address:
+            # Format address for ATM receipt style
+            address_short = business.address[:35] + "..." if len(business.address) > 35 else business.address
+            lines.append(('small', address_short))
+        
+        if business.phone:
+            lines.append(('small', f"Telp: {business.phone}"))
+    else:
+        lines.append(('bold', "BANK FAJARMANDIRI"))
+        lines.append(('normal', "LAYANAN TABUNGAN"))
+        lines.append(('small', "Kec. Lembang, Bandung Barat"))
+    
+    lines.append(('rule', '='))
+    
+    # Transaction details - Bank style
+    transaction_type = 'SETORAN' if transaction.type == 'deposit' else 'PENARIKAN'
+    lines.append(('bold', f"TRANSAKSI {transaction_type}"))
+    lines.append(('rule', '='))
+    
+    # Account info
+    lines.append(('small', f"NAMA     : {transaction.saver.name.upper()}"))
+    lines.append(('small', f"NO.REF   : {str(transaction.id).zfill(8)}"))
+    lines.append(('small', f"TANGGAL  : {transaction.date.strftime('%d/%m/%Y')}"))
+    lines.append(('small', f"WAKTU    : {transaction.created_at.strftime('%H:%M:%S')}"))
+    lines.append(('rule', '-'))
+    
+    # Transaction amount
+    lines.append(('normal', f"NOMINAL  : {format_currency(transaction.amount)}"))
+    lines.append(('bold', f"SALDO    : {format_currency(transaction.balance_after)}"))
+    
+    if transaction.description:
+        lines.append(('small', f"KET      : {transaction.description[:25]}"))
+    
+    lines.append(('rule', '='))
+    
+    # Status
+    lines.append(('bold', "TRANSAKSI BERHASIL"))
+    lines.append(('normal', "*** SIMPAN STRUK INI ***"))
+    lines.append(('small', "SEBAGAI BUKTI TRANSAKSI"))
+    lines.append(('rule', '-'))
+    
+    # Footer
+    lines.append(('normal', "TERIMA KASIH"))
+    lines.append(('small', "TELAH MENABUNG"))
+    
+    if business and business.phone:
+        lines.append(('small', f"Info: {business.phone}"))
+    
+    # Print time
+    lines.append(('small', f"Print: {datetime.now().strftime('%d/%m/%y %H:%M')}"))
+    return lines
+
+def render_receipt_pdf(lines, page_height, rule_width):
+    """Render receipt layout lines as a thermal printer sized PDF"""
+    buffer = io.BytesIO()
+    # Use smaller page size to mimic real thermal printer receipt.
+    # Content is left uncompressed so stamp_receipt_printed_at can patch the text.
+    doc = SimpleDocTemplate(buffer, pagesize=(200, page_height), topMargin=10, bottomMargin=10, leftMargin=10, rightMargin=10,
+                            pageCompression=0)
+    styles = getSampleStyleSheet()
+    
+    # Create custom styles for receipt
+    receipt_style = ParagraphStyle(
+        'Receipt',
+        parent=styles['Normal'],
+        fontSize=8,
+        alignment=1,  # Center alignment
+        fontName='Courier'
+    )
+    
+    line_styles = {
+        'normal': receipt_style,
+        'bold': ParagraphStyle(
+            'ReceiptBold',
+            parent=receipt_style,
+            fontName='Courier-Bold',
+            fontSize=9
+        ),
+        'small': ParagraphStyle(
+            'ReceiptSmall',
+            parent=receipt_style,
+            fontSize=7
+        )
+    }
+    
+    elements = []
+    for style, text in lines:
+        if style == 'rule':
+            elements.append(Paragraph(text * rule_width, line_styles['small']))
+        else:
+            elements.append(Paragraph(text, line_styles[style]))
     
     doc.build(elements)
     buffer.seek(0)
     return buffer
 
-def generate_savings_statement_pdf(saver):
-    """Generate savings statement PDF"""
+ESCPOS_LINE_WIDTH = 32  # characters per line on a 58mm printer (font A)
+
+def render_receipt_escpos(lines, width=ESCPOS_LINE_WIDTH):
+    """Render receipt layout lines as raw ESC/POS thermal printer commands"""
+    output = bytearray(b'\x1b@')  # ESC @ - initialize printer
+    output += b'\x1ba\x01'  # ESC a 1 - center alignment
+    
+    for style, text in lines:
+        if style == 'rule':
+            output += (text * width).encode('ascii') + b'\n'
+            continue
+        
+        if style == 'bold':
+            output += b'\x1bE\x01'  # ESC E 1 - emphasized on
+        for chunk in textwrap.wrap(text, width) or ['']:
+            output += chunk.replace('©', '(c)').encode('cp437', errors='replace') + b'\n'
+        if style == 'bold':
+            output += b'\x1bE\x00'  # ESC E 0 - emphasized off
+    
+    output += b'\n\n\n'
+    output += b'\x1dVB\x00'  # GS V B 0 - feed and partial cut
+    return bytes(output)
+
+# PDF Generation Functions
+def generate_receipt_pdf(transaction):
+    """Generate receipt PDF for transaction - Real store receipt style"""
+    if not REPORTLAB_AVAILABLE:
+        return None
+    
+    return render_receipt_pdf(build_sale_receipt_lines(transaction), page_height=800, rule_width=40)
+
+def stamp_receipt_printed_at(pdf_data, printed_at):
+    """Fill the print time into a receipt PDF rendered with the placeholder
+    
+    The replacement has the same length, so stream lengths and xref offsets
+    stay valid and the cached bytes can be reused for every print.
+    """
+    return pdf_data.replace(
+        RECEIPT_PRINTED_AT_PLACEHOLDER.encode('ascii'),
+        printed_at.strftime('%d/%m/%Y %H:%M').encode('ascii'),
+        1
+    )
+
+def generate_savings_receipt_pdf(transaction):
+    """Generate savings transaction receipt PDF - ATM/Bank receipt style"""
+    if not REPORTLAB_AVAILABLE:
+        return None
+    
+    return render_receipt_pdf(build_savings_receipt_lines(transaction), page_height=600, rule_width=35)
+
+def generate_savings_statement_pdf(saver, start_date, end_date):
+    """Generate savings statement PDF for start_date..end_date
+    
+    Transactions are fetched STATEMENT_PDF_CHUNK_ROWS at a time, each chunk
+    becoming its own LongTable, so long histories never sit in one table.
+    """
     if not REPORTLAB_AVAILABLE:
         return None
     
@@ -642,24 +2090,16 @@ def generate_savings_statement_pdf(saver):
         elements.append(Paragraph(f"Alamat: {saver.address}", styles['Normal']))
     
     elements.append(Paragraph(f"Saldo Saat Ini: {format_currency(saver.get_balance())}", styles['Heading2']))
+    elements.append(Paragraph(
+        f"Periode: {start_date.strftime('%d/%m/%Y')} - {end_date.strftime('%d/%m/%Y')}", styles['Normal']
+    ))
+    balance = get_saver_balance_at(saver.id, start_date)
+    elements.append(Paragraph(f"Saldo Awal: {format_currency(balance)}", styles['Normal']))
     elements.append(Spacer(1, 12))
     
-    # Transactions table
-    transactions = SavingsTransaction.query.filter_by(saver_id=saver.id).order_by(SavingsTransaction.date.desc()).all()
-    
-    data = [['Tanggal', 'Jenis', 'Jumlah', 'Keterangan', 'Saldo']]
-    
-    for transaction in transactions:
-        data.append([
-            transaction.date.strftime('%d/%m/%Y'),
-            'Setor' if transaction.type == 'deposit' else 'Tarik',
-            format_currency(transaction.amount),
-            transaction.description[:30],
-            format_currency(transaction.balance_after)
-        ])
-    
-    table = Table(data)
-    table.setStyle(TableStyle([
+    # Transactions tables, one LongTable per chunk with the header repeated on every page
+    header = ['Tanggal', 'Jenis', 'Jumlah', 'Keterangan', 'Saldo']
+    table_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -668,9 +2108,36 @@ def generate_savings_statement_pdf(saver):
         ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
         ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    ])
+    result = db.session.execute(
+        db.select(SavingsTransaction.date, SavingsTransaction.type, SavingsTransaction.amount, SavingsTransaction.description)
+        .where(_statement_filter(saver.id, start_date, end_date))
+        .order_by(SavingsTransaction.date, SavingsTransaction.id),
+        execution_options={'yield_per': STATEMENT_PDF_CHUNK_ROWS}
+    )
     
-    elements.append(table)
+    has_transactions = False
+    for partition in result.partitions():
+        data = [header]
+        for entry_date, transaction_type, amount, description in partition:
+            balance += amount if transaction_type == 'deposit' else -amount
+            data.append([
+                entry_date.strftime('%d/%m/%Y'),
+                'Setor' if transaction_type == 'deposit' else 'Tarik',
+                format_currency(amount),
+                (description or '-')[:30],
+                format_currency(balance)
+            ])
+        table = LongTable(data, colWidths=[70, 45, 95, 180, 95], repeatRows=1)
+        table.setStyle(table_style)
+        elements.append(table)
+        has_transactions = True
+    
+    if not has_transactions:
+        elements.append(Paragraph("Tidak ada transaksi pada periode ini.", styles['Normal']))
+    
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph(f"Saldo Akhir Periode: {format_currency(balance)}", styles['Heading2']))
     elements.append(Spacer(1, 24))
     elements.append(Paragraph(f"Dicetak pada: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
     
@@ -989,14 +2456,18 @@ def generate_admin_report_pdf(start_date, end_date):
     elements.append(Spacer(1, 12))
     
     # Revenue calculation
-    transactions = CashierTransaction.query.filter(
-        CashierTransaction.timestamp >= datetime.strptime(start_date, '%Y-%m-%d'),
-        CashierTransaction.timestamp <= datetime.strptime(end_date, '%Y-%m-%d')
-    ).all()
-    
-    total_revenue = sum(t.total for t in transactions)
-    total_profit = sum(t.profit for t in transactions)
-    total_loss = total_revenue - total_profit - sum(t.total for t in transactions if t.profit < 0)
+    period_start = datetime.strptime(start_date, '%Y-%m-%d')
+    period_end = datetime.strptime(end_date, '%Y-%m-%d')
+    summary = get_sales_summary(period_start.date(), period_end.date())
+    
+    total_revenue = summary['revenue']
+    total_profit = summary['profit']
+    loss_revenue = db.session.query(db.func.coalesce(db.func.sum(CashierTransaction.total), 0)).filter(
+        CashierTransaction.timestamp >= period_start,
+        CashierTransaction.timestamp < period_end + timedelta(days=1),
+        CashierTransaction.profit < 0
+    ).scalar()
+    total_loss = total_revenue - total_profit - loss_revenue
     
     # Summary table
     summary_data = [
@@ -1004,7 +2475,7 @@ def generate_admin_report_pdf(start_date, end_date):
         ['Total Penjualan', format_currency(total_revenue)],
         ['Total Keuntungan', format_currency(total_profit)],
         ['Total Kerugian', format_currency(abs(total_loss) if total_loss < 0 else 0)],
-        ['Jumlah Transaksi', str(len(transactions))]
+        ['Jumlah Transaksi', str(summary['txn_count'])]
     ]
     
     summary_table = Table(summary_data)
@@ -1023,17 +2494,7 @@ def generate_admin_report_pdf(start_date, end_date):
     elements.append(Paragraph("ITEM TERLARIS", styles['Heading2']))
     
     # Calculate best selling items
-    item_sales = {}
-    for transaction in transactions:
-        items = json.loads(transaction.items)
-        for item in items:
-            if item['name'] in item_sales:
-                item_sales[item['name']] += item['quantity']
-            else:
-                item_sales[item['name']] = item['quantity']
-    
-    # Sort by quantity sold
-    sorted_items = sorted(item_sales.items(), key=lambda x: x[1], reverse=True)[:10]
+    sorted_items = get_best_selling_items(period_start, period_end + timedelta(days=1), limit=10)
     
     bestseller_data = [['Item', 'Terjual']]
     for item, qty in sorted_items:
@@ -1053,14 +2514,14 @@ def generate_admin_report_pdf(start_date, end_date):
     
     # Low stock items
     elements.append(Paragraph("STOK RENDAH", styles['Heading2']))
-    low_stock_items = InventoryItem.query.filter(InventoryItem.current_stock <= InventoryItem.minimum_stock).all()
+    low_stock_items = get_low_stock_entries()
     
     stock_data = [['Item', 'Stok Saat Ini', 'Minimum Stok']]
     for item in low_stock_items:
         stock_data.append([
-            item.product.name[:30],
-            str(item.current_stock),
-            str(item.minimum_stock)
+            item['name'][:30],
+            str(item['current_stock']),
+            str(item['minimum_stock'])
         ])
     
     stock_table = Table(stock_data)
@@ -1080,6 +2541,122 @@ def generate_admin_report_pdf(start_date, end_date):
     buffer.seek(0)
     return buffer
 
+# Receipt cache: receipts are rendered in the background right after a sale commits
+class ReceiptCache:
+    """Bounded LRU cache of rendered receipt PDFs, evicted entries spill to disk
+    
+    Keys carry the business settings version, so a settings change made in
+    any worker process stops old receipts from being served everywhere.
+    """
+    
+    def __init__(self, directory, max_memory_items=200, max_disk_items=5000):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+    
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+        
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # keep disk eviction least-recently-used too
+        except OSError:
+            return None
+        
+        self.put(key, data)
+        return data
+    
+    def put(self, key, data):
+        spilled = []
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_memory_items:
+                spilled.append(self._items.popitem(last=False))
+        
+        if spilled:
+            for spilled_key, spilled_data in spilled:
+                self._spill(spilled_key, spilled_data)
+            self._trim_disk()
+    
+    def _spill(self, key, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logging.warning(f"Receipt cache spill failed: {e}")
+    
+    def _trim_disk(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pdf')]
+        except OSError:
+            return
+        if len(entries) <= self.max_disk_items:
+            return
+        
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_items]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    
+    def clear(self):
+        """Drop every cached receipt, e.g. after business settings change"""
+        with self._lock:
+            self._items.clear()
+        
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pdf'):
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+RECEIPT_LAYOUT_VERSION = 2  # bump when the cached receipt body changes, old files are then ignored
+
+receipt_cache = ReceiptCache(os.path.join(app.instance_path, 'receipt_cache'))
+_receipt_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipt-render')
+
+def receipt_cache_key(transaction_id):
+    """Cache key of a receipt, tied to the business settings it was rendered with"""
+    updated_at = db.session.query(db.func.max(BusinessSettings.updated_at)).scalar()
+    version = updated_at.strftime('%Y%m%d%H%M%S%f') if updated_at else '0'
+    return f'{transaction_id}-{version}-{RECEIPT_LAYOUT_VERSION}'
+
+def _render_receipt(transaction_id):
+    with app.app_context():
+        try:
+            transaction = db.session.get(CashierTransaction, transaction_id)
+            if transaction:
+                key = receipt_cache_key(transaction_id)
+                pdf_buffer = generate_receipt_pdf(transaction)
+                if pdf_buffer:
+                    receipt_cache.put(key, pdf_buffer.getvalue())
+        except Exception as e:
+            logging.warning(f"Receipt pre-render failed for transaction {transaction_id}: {e}")
+
+def schedule_receipt_render(transaction_ids):
+    """Render receipts of committed transactions in the background"""
+    if not REPORTLAB_AVAILABLE:
+        return
+    for transaction_id in transaction_ids:
+        _receipt_executor.submit(_render_receipt, transaction_id)
+
 # Routes
 @app.route('/')
 def index():
@@ -1152,45 +2729,440 @@ def dashboard():
     """Main dashboard"""
     user = User.query.get(session['user_id'])
     
-    # Get business settings
+    # Business settings are created by init_database
     business = BusinessSettings.query.first()
-    if not business:
-        business = BusinessSettings()
-        db.session.add(business)
+    stats = get_dashboard_stats()
+    
+    return render_template('dashboard.html', user=user, business=business, stats=stats, format_currency=format_currency)
+
+# Product list uses keyset pagination so page cost follows page size, not catalog size
+PRODUCT_LIST_PAGE_SIZE = 50
+PRODUCT_LIST_MAX_PAGE_SIZE = 200
+FORECAST_NO_DEMAND_DAYS = 999999  # sorts products without recent sales after every forecast
+PRODUCT_SORT_COLUMNS = {
+    'name': Product.name,
+    'id': Product.id,
+    'price': Product.selling_price,
+    'stock': Product.current_stock,
+    'sold': Product.total_sold,
+    'revenue': Product.total_revenue,
+    'stockout': db.func.coalesce(ProductForecast.days_until_stockout, FORECAST_NO_DEMAND_DAYS),
+    'abc': db.func.coalesce(ProductForecast.abc_class, 'C')
+}
+
+def encode_cursor(values):
+    """Encode keyset values as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, None when missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+def filter_products(query, args):
+    """Apply category, brand, status and low stock filters from request args"""
+    legacy_filter = args.get('filter')  # older ?filter= links from the list page
+    
+    if args.get('category'):
+        query = query.filter(Product.category == args['category'])
+    if args.get('brand'):
+        query = query.filter(Product.brand == args['brand'])
+    
+    status = args.get('status') or ('inactive' if legacy_filter == 'inactive' else None)
+    if status == 'active':
+        query = query.filter(Product.is_active == True)
+    elif status == 'inactive':
+        query = query.filter(Product.is_active == False)
+    
+    if args.get('low_stock') or legacy_filter == 'low_stock':
+        query = query.filter(Product.current_stock <= Product.minimum_stock)
+    if legacy_filter == 'expired':
+        query = query.filter(Product.expiry_date < datetime.now().date())
+    
+    return query
+
+def get_product_page(args):
+    """Return (products, next_cursor) for one page of the filtered, sorted product list"""
+    sort = args.get('sort') if args.get('sort') in PRODUCT_SORT_COLUMNS else 'name'
+    column = PRODUCT_SORT_COLUMNS[sort]
+    descending = args.get('order') == 'desc'
+    limit = min(max(args.get('limit', PRODUCT_LIST_PAGE_SIZE, type=int), 1), PRODUCT_LIST_MAX_PAGE_SIZE)
+    
+    # The forecast join is one row per product and also fills product.forecast for the template
+    query = filter_products(
+        db.session.query(Product, column.label('sort_value'))
+        .outerjoin(ProductForecast, ProductForecast.product_id == Product.id)
+        .options(db.contains_eager(Product.forecast)),
+        args
+    )
+    
+    cursor = decode_cursor(args.get('after'))
+    if cursor:
+        value, last_id = cursor
+        if descending:
+            query = query.filter(db.or_(column < value, db.and_(column == value, Product.id < last_id)))
+        else:
+            query = query.filter(db.or_(column > value, db.and_(column == value, Product.id > last_id)))
+    
+    ordering = [column.desc(), Product.id.desc()] if descending else [column, Product.id]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].sort_value, rows[-1].Product.id])
+    
+    return [row.Product for row in rows], next_cursor
+
+def get_product_summary():
+    """Catalog-wide totals for the product list summary cards, in one query"""
+    row = db.session.query(
+        db.func.count(Product.id).label('total'),
+        db.func.coalesce(db.func.sum(db.case((Product.is_active == True, 1), else_=0)), 0).label('active'),
+        db.func.coalesce(db.func.sum(db.case(
+            (db.func.coalesce(Product.current_stock, 0) <= db.func.coalesce(Product.minimum_stock, 5), 1), else_=0
+        )), 0).label('low_stock'),
+        db.func.coalesce(db.func.sum(Product.total_revenue), 0).label('total_revenue')
+    ).one()
+    return dict(row._mapping)
+
+# Inventory list, keyset-paginated by item code
+INVENTORY_PAGE_SIZE = 50
+
+def get_inventory_page(args):
+    """Return (items, next_cursor) for one page of inventory items, with product names from the same query"""
+    limit = min(max(args.get('limit', INVENTORY_PAGE_SIZE, type=int), 1), PRODUCT_LIST_MAX_PAGE_SIZE)
+    
+    query = InventoryItem.query.join(InventoryItem.product).options(
+        db.contains_eager(InventoryItem.product).load_only(Product.id, Product.name)
+    )
+    search = args.get('search', '').strip()
+    if search:
+        query = query.filter(db.or_(InventoryItem.code.startswith(search), Product.name.contains(search)))
+    if args.get('low_stock'):
+        query = query.filter(InventoryItem.id.in_(
+            db.select(LowStockWatch.inventory_item_id).where(LowStockWatch.inventory_item_id.isnot(None))
+        ))
+    if args.get('after'):
+        query = query.filter(InventoryItem.code > args['after'])
+    
+    items = query.order_by(InventoryItem.code).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].code
+    return items, next_cursor
+
+def get_inventory_summary():
+    """Inventory-wide totals for the summary cards, in one query"""
+    row = db.session.query(
+        db.func.count(InventoryItem.id).label('total'),
+        db.func.coalesce(db.func.sum(InventoryItem.current_stock), 0).label('total_stock'),
+        db.func.coalesce(db.func.sum(InventoryItem.selling_price), 0).label('total_value'),
+        db.select(db.func.count()).select_from(LowStockWatch).where(
+            LowStockWatch.inventory_item_id.isnot(None)
+        ).scalar_subquery().label('low_stock')
+    ).one()
+    return dict(row._mapping)
+
+# Bulk product import from CSV
+PRODUCT_IMPORT_BATCH_SIZE = 500
+PRODUCT_IMPORT_MAX_ERRORS = 1000
+PRODUCT_IMPORT_TEXT_FIELDS = ('description', 'category', 'brand', 'supplier', 'dimensions')
+PRODUCT_IMPORT_NUMBER_FIELDS = {
+    'purchase_price': (float, 0.0),
+    'selling_price': (float, 0.0),
+    'weight': (float, 0.0),
+    'initial_stock': (int, 0),
+    'minimum_stock': (int, 5),
+    'maximum_stock': (int, 1000)
+}
+
+def parse_product_import_row(row):
+    """Turn one CSV row into product column values, raises ValueError with the reason"""
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError('Nama produk wajib diisi')
+    
+    product_id = (row.get('id') or '').strip().upper()
+    if product_id and not is_valid_product_id(product_id):
+        raise ValueError('Format ID produk tidak valid')
+    
+    values = {'id': product_id or None, 'name': name, 'unit': (row.get('unit') or '').strip() or 'pcs'}
+    for field in PRODUCT_IMPORT_TEXT_FIELDS:
+        values[field] = (row.get(field) or '').strip() or None
+    
+    for field, (cast, default) in PRODUCT_IMPORT_NUMBER_FIELDS.items():
+        raw = (row.get(field) or '').strip()
+        try:
+            values[field] = cast(float(raw)) if raw else default
+        except ValueError:
+            raise ValueError(f'Nilai {field} tidak valid: {raw}')
+    
+    raw_stock = (row.get('current_stock') or '').strip()
+    try:
+        values['current_stock'] = int(float(raw_stock)) if raw_stock else values['initial_stock']
+    except ValueError:
+        raise ValueError(f'Nilai current_stock tidak valid: {raw_stock}')
+    
+    raw_expiry = (row.get('expiry_date') or '').strip()
+    try:
+        values['expiry_date'] = datetime.strptime(raw_expiry, '%Y-%m-%d').date() if raw_expiry else None
+    except ValueError:
+        raise ValueError(f'Format expiry_date harus YYYY-MM-DD: {raw_expiry}')
+    
+    # Profit formula as in add_product: BT = SA + Pembelian - SK
+    items_sold = values['initial_stock'] - values['current_stock']
+    values['total_sold'] = items_sold
+    values['profit'] = (values['selling_price'] - values['purchase_price']) * items_sold if items_sold > 0 else 0
+    values['total_revenue'] = values['selling_price'] * items_sold if items_sold > 0 else 0
+    return values
+
+def _insert_product_batch(batch, report):
+    """Insert one batch of parsed rows in its own transaction"""
+    existing = {row[0] for row in db.session.query(Product.id).filter(
+        Product.id.in_([values['id'] for _, values in batch if values['id']])
+    )}
+    
+    reserved_limit = reserved_product_id_limit()
+    pending = []
+    for line_number, values in batch:
+        if values['id'] in existing:
+            report['errors'].append({'row': line_number, 'id': values['id'], 'message': 'ID Produk sudah ada'})
+        elif values['id'] and is_reserved_product_id(values['id'], reserved_limit):
+            report['errors'].append({'row': line_number, 'id': values['id'],
+                                     'message': 'ID Produk termasuk rentang ID otomatis yang sudah dicadangkan'})
+        else:
+            pending.append((line_number, values))
+    
+    # Commit the reservation on its own so a failed insert leaves a gap, never a reused ID
+    new_ids = iter(reserve_product_ids(
+        sum(1 for _, values in pending if not values['id']),
+        skip={values['id'] for _, values in pending if values['id']}
+    ))
+    db.session.commit()
+    rows = []
+    for line_number, values in pending:
+        values['id'] = values['id'] or next(new_ids)
+        values['barcode'] = generate_barcode_data(values['id'])
+        values['qr_code'] = generate_qr_data(values['id'], values['name'])
+        rows.append(values)
+    
+    if not rows:
+        return
+    
+    try:
+        db.session.execute(Product.__table__.insert(), rows)
+        record_stock_movements([
+            {'product_id': values['id'], 'delta': values['current_stock'], 'reason': 'import', 'reference': 'import_products'}
+            for values in rows
+        ])
         db.session.commit()
+        report['imported'] += len(rows)
+        return
+    except Exception:
+        db.session.rollback()
     
-    # Get statistics
-    stats = {
-        'total_products': Product.query.count(),
-        'total_inventory_items': InventoryItem.query.count(),
-        'low_stock_items': InventoryItem.query.filter(InventoryItem.current_stock <= InventoryItem.minimum_stock).count(),
-        'total_savers': Saver.query.count(),
-        'total_savings': db.session.query(db.func.sum(SavingsTransaction.amount)).filter(SavingsTransaction.type == 'deposit').scalar() or 0,
-        'total_invoices': Invoice.query.count(),
-        'pending_invoices': Invoice.query.filter_by(status='draft').count(),
-        'total_transactions': CashierTransaction.query.count(),
-        'today_revenue': 0,
-        'total_customers': Customer.query.count(),
-        'total_debts': db.session.query(db.func.sum(CustomerDebt.remaining_amount)).filter(CustomerDebt.status == 'active').scalar() or 0,
-        'overdue_debts': CustomerDebt.query.filter(CustomerDebt.due_date < datetime.now().date(), CustomerDebt.status == 'active').count()
+    # The batch hit a constraint, retry row by row to report the offending lines
+    for (line_number, _), values in zip(pending, rows):
+        try:
+            db.session.execute(Product.__table__.insert(), values)
+            record_stock_movements([
+                {'product_id': values['id'], 'delta': values['current_stock'], 'reason': 'import', 'reference': 'import_products'}
+            ])
+            db.session.commit()
+            report['imported'] += 1
+        except Exception as e:
+            db.session.rollback()
+            report['errors'].append({'row': line_number, 'id': values['id'], 'message': str(getattr(e, 'orig', e))})
+
+def import_products_csv(lines, batch_size=PRODUCT_IMPORT_BATCH_SIZE):
+    """Stream products from CSV lines into the database in batched transactions
+    
+    Returns a report with the number of imported products and row-level errors.
+    """
+    report = {'total_rows': 0, 'imported': 0, 'errors': []}
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or 'name' not in [field.strip() for field in reader.fieldnames]:
+        report['errors'].append({'row': 1, 'id': None, 'message': 'Header CSV harus memiliki kolom name'})
+        return report
+    reader.fieldnames = [field.strip() for field in reader.fieldnames]
+    
+    seen_ids = set()
+    batch = []
+    for row in reader:
+        report['total_rows'] += 1
+        line_number = reader.line_num
+        try:
+            values = parse_product_import_row(row)
+            if values['id'] in seen_ids:
+                raise ValueError('ID Produk duplikat di dalam file')
+        except ValueError as e:
+            report['errors'].append({'row': line_number, 'id': (row.get('id') or '').strip() or None, 'message': str(e)})
+            continue
+        
+        if values['id']:
+            seen_ids.add(values['id'])
+        batch.append((line_number, values))
+        if len(batch) >= batch_size:
+            _insert_product_batch(batch, report)
+            batch = []
+    
+    if batch:
+        _insert_product_batch(batch, report)
+    
+    report['errors'].sort(key=lambda error: error['row'])
+    if report['imported']:
+        invalidate_scan_index()
+        invalidate_dashboard_stats()
+    return report
+
+# Bulk repricing: preview and apply share the same SQL price expressions
+REPRICE_PREVIEW_LIMIT = 200
+REPRICE_ROUNDING_STEPS = (0, 100, 500)
+
+def parse_reprice_form(form):
+    """Validate the repricing form, raises ValueError with the reason"""
+    params = {
+        'category': form.get('category', '').strip(),
+        'brand': form.get('brand', '').strip(),
+        'supplier': form.get('supplier', '').strip(),
+        'target': form.get('target', 'selling'),
+        'mode': form.get('mode', 'percent'),
     }
+    if not (params['category'] or params['brand'] or params['supplier']):
+        raise ValueError('Pilih minimal satu kategori, brand atau supplier!')
+    if params['target'] not in ('selling', 'purchase', 'both'):
+        raise ValueError('Target harga tidak valid!')
+    if params['mode'] not in ('percent', 'amount'):
+        raise ValueError('Jenis perubahan tidak valid!')
     
-    # Calculate today's revenue
-    today = datetime.now().date()
-    today_transactions = CashierTransaction.query.filter(
-        db.func.date(CashierTransaction.timestamp) == today
-    ).all()
-    stats['today_revenue'] = sum(t.total for t in today_transactions)
+    try:
+        params['value'] = float(form.get('value', 0))
+        params['rounding'] = int(form.get('rounding', 0))
+    except (ValueError, TypeError):
+        raise ValueError('Nilai perubahan tidak valid!')
+    if params['rounding'] not in REPRICE_ROUNDING_STEPS:
+        raise ValueError('Pembulatan tidak valid!')
     
-    return render_template('dashboard.html', user=user, business=business, stats=stats, format_currency=format_currency)
+    return params
+
+def _reprice_filters(params):
+    filters = []
+    if params['category']:
+        filters.append(Product.category == params['category'])
+    if params['brand']:
+        filters.append(Product.brand == params['brand'])
+    if params['supplier']:
+        filters.append(Product.supplier == params['supplier'])
+    return filters
+
+def _repriced(column, params, target):
+    """SQL expression for the new value of a price column, unchanged when not targeted"""
+    if params['target'] not in (target, 'both'):
+        return column
+    
+    if params['mode'] == 'percent':
+        price = column * (1 + params['value'] / 100)
+    else:
+        price = column + params['value']
+    if params['rounding']:
+        price = db.func.round(price / params['rounding']) * params['rounding']
+    return db.func.max(price, 0)
+
+def _margin(purchase_price, selling_price):
+    return db.case((selling_price > 0, (selling_price - purchase_price) * 100.0 / selling_price), else_=None)
+
+def preview_reprice(params):
+    """Return (summary, sample rows) of the repricing without changing anything"""
+    new_purchase = _repriced(Product.purchase_price, params, 'purchase')
+    new_selling = _repriced(Product.selling_price, params, 'selling')
+    filters = _reprice_filters(params)
+    
+    summary = db.session.query(
+        db.func.count(Product.id).label('count'),
+        db.func.avg(_margin(Product.purchase_price, Product.selling_price)).label('margin_before'),
+        db.func.avg(_margin(new_purchase, new_selling)).label('margin_after'),
+        db.func.sum(db.case((new_selling < new_purchase, 1), else_=0)).label('below_cost')
+    ).filter(*filters).one()
+    
+    rows = db.session.query(
+        Product.id, Product.name, Product.purchase_price, Product.selling_price,
+        new_purchase.label('new_purchase_price'), new_selling.label('new_selling_price'),
+        _margin(Product.purchase_price, Product.selling_price).label('margin_before'),
+        _margin(new_purchase, new_selling).label('margin_after')
+    ).filter(*filters).order_by(Product.name, Product.id).limit(REPRICE_PREVIEW_LIMIT).all()
+    
+    return dict(summary._mapping), rows
+
+def apply_reprice(params):
+    """Reprice every selected product and refresh profit in one UPDATE, returns the row count"""
+    new_purchase = _repriced(Product.purchase_price, params, 'purchase')
+    new_selling = _repriced(Product.selling_price, params, 'selling')
+    products_table = Product.__table__
+    items_sold = products_table.c.initial_stock - products_table.c.current_stock
+    
+    # SET expressions read the old column values, so profit uses both new prices
+    result = db.session.execute(
+        products_table.update().where(*_reprice_filters(params)).values(
+            purchase_price=new_purchase,
+            selling_price=new_selling,
+            profit=db.case((items_sold > 0, (new_selling - new_purchase) * items_sold), else_=0),
+            updated_at=datetime.utcnow()
+        )
+    )
+    return result.rowcount
 
 # Product Management Routes
 @app.route('/products')
 @manager_required
 def products():
-    """Product list"""
-    products = Product.query.all()
-    return render_template('products/list.html', products=products, format_currency=format_currency)
+    """Product list, one keyset page at a time (?format=json for infinite scroll)"""
+    products, next_cursor = get_product_page(request.args)
+    
+    next_url = None
+    if next_cursor:
+        page_args = {key: value for key, value in request.args.items() if key not in ('after', 'format')}
+        next_url = url_for('products', after=next_cursor, format='json', **page_args)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'products': [{
+                'id': product.id,
+                'name': product.name,
+                'category': product.category,
+                'brand': product.brand,
+                'purchase_price': product.purchase_price,
+                'selling_price': product.selling_price,
+                'current_stock': product.current_stock,
+                'minimum_stock': product.minimum_stock,
+                'total_sold': product.total_sold,
+                'total_revenue': product.total_revenue,
+                'is_active': product.is_active
+            } for product in products],
+            'html': render_template('products/list_rows.html', products=products),
+            'next_cursor': next_cursor,
+            'next_url': next_url
+        })
+    
+    categories = [row[0] for row in db.session.query(Product.category).filter(Product.category.isnot(None)).distinct().order_by(Product.category)]
+    brands = [row[0] for row in db.session.query(Product.brand).filter(Product.brand.isnot(None)).distinct().order_by(Product.brand)]
+    
+    return render_template('products/list.html',
+                         products=products,
+                         summary=get_product_summary(),
+                         categories=categories,
+                         brands=brands,
+                         sort_options=PRODUCT_SORT_COLUMNS,
+                         next_url=next_url,
+                         format_currency=format_currency)
 
 @app.route('/products/edit/<product_id>', methods=['GET', 'POST'])
 @manager_required
@@ -1230,7 +3202,17 @@ def edit_product(product_id):
         
         product.updated_at = datetime.utcnow()
         
+        reference = f'edit_product:{product.id}'
+        record_stock_movements([
+            {'product_id': product.id, 'delta': additional_stock if additional_stock > 0 else 0,
+             'reason': 'purchase', 'reference': reference},
+            {'product_id': product.id, 'delta': input_current_stock - original_current_stock,
+             'reason': 'adjustment', 'reference': reference}
+        ], user_id=session.get('user_id'))
+        
         db.session.commit()
+        invalidate_scan_index()
+        invalidate_dashboard_stats()
         
         if additional_stock > 0:
             flash(f'Produk berhasil diperbarui! Stok bertambah {additional_stock} unit.', 'success')
@@ -1247,22 +3229,20 @@ def add_product():
     if request.method == 'POST':
         product_id = request.form.get('product_id', '').strip().upper()
         
-        # Validate product ID
-        if not product_id:
-            product_id = generate_product_id()
-            if not product_id:
-                flash('Gagal membuat ID produk otomatis!', 'error')
-                return render_template('products/add.html', generated_id=None)
-        else:
-            # Validate manual input
+        # Validate manual input, an empty ID is generated once the form is accepted
+        if product_id:
             if not is_valid_product_id(product_id):
                 flash('Format ID produk tidak valid! Maksimal 50 karakter, hanya huruf, angka, underscore (_) dan dash (-)', 'error')
-                return render_template('products/add.html', generated_id=generate_product_id())
-        
-        # Check if product ID already exists
-        if Product.query.get(product_id):
-            flash('ID Produk sudah ada! Silakan gunakan ID lain.', 'error')
-            return render_template('products/add.html', generated_id=generate_product_id())
+                return render_template('products/add.html', generated_id=peek_product_id())
+            
+            if is_reserved_product_id(product_id, reserved_product_id_limit()):
+                flash('ID Produk termasuk rentang ID otomatis yang sudah dicadangkan! Kosongkan untuk ID otomatis atau gunakan ID lain.', 'error')
+                return render_template('products/add.html', generated_id=peek_product_id())
+            
+            # Check if product ID already exists
+            if Product.query.get(product_id):
+                flash('ID Produk sudah ada! Silakan gunakan ID lain.', 'error')
+                return render_template('products/add.html', generated_id=peek_product_id())
         
         # Basic information
         name = request.form.get('name')
@@ -1316,7 +3296,8 @@ def add_product():
         if request.form.get('expiry_date'):
             expiry_date = datetime.strptime(request.form.get('expiry_date'), '%Y-%m-%d').date()
         
-        
+        if not product_id:
+            product_id = generate_product_id()
         
         # Generate barcode and QR code data
         barcode_data = generate_barcode_data(product_id)
@@ -1352,20 +3333,203 @@ def add_product():
         )
         
         db.session.add(product)
+        record_stock_movements([
+            {'product_id': product_id, 'delta': current_stock, 'reason': 'initial', 'reference': 'add_product'}
+        ], user_id=session.get('user_id'))
         db.session.commit()
+        invalidate_scan_index()
+        invalidate_dashboard_stats()
+        
+        flash('Produk berhasil ditambahkan dengan informasi lengkap!', 'success')
+        return redirect(url_for('products'))
+    
+    return render_template('products/add.html', generated_id=peek_product_id())
+
+# Inventory Management Routes
+@app.route('/products/import', methods=['GET', 'POST'])
+@manager_required
+def import_products():
+    """Bulk import products from a CSV file"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Pilih file CSV terlebih dahulu!', 'error')
+            return redirect(url_for('import_products'))
+        
+        report = import_products_csv(codecs.iterdecode(upload.stream, 'utf-8-sig'))
+        
+        if request.args.get('format') == 'json':
+            return jsonify({'success': not report['errors'], **report})
+        
+        flash(f"{report['imported']} dari {report['total_rows']} produk berhasil diimport.",
+              'success' if not report['errors'] else 'warning')
+        return render_template('products/import.html', report=report,
+                               errors=report['errors'][:PRODUCT_IMPORT_MAX_ERRORS])
+    
+    return render_template('products/import.html', report=None, errors=[])
+
+@app.route('/products/reprice', methods=['GET', 'POST'])
+@manager_required
+def reprice_products():
+    """Bulk repricing by category, brand or supplier with a margin preview"""
+    def distinct_values(column):
+        return [row[0] for row in db.session.query(column).filter(column.isnot(None), column != '').distinct().order_by(column)]
+    
+    context = {
+        'categories': distinct_values(Product.category),
+        'brands': distinct_values(Product.brand),
+        'suppliers': distinct_values(Product.supplier),
+        'form': request.form,
+        'summary': None,
+        'rows': [],
+        'preview_limit': REPRICE_PREVIEW_LIMIT
+    }
+    
+    if request.method == 'POST':
+        try:
+            params = parse_reprice_form(request.form)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return render_template('products/reprice.html', **context)
+        
+        if request.form.get('action') == 'apply':
+            try:
+                updated = apply_reprice(params)
+                db.session.commit()
+                invalidate_scan_index()
+                flash(f'Harga {updated} produk berhasil diperbarui!', 'success')
+                return redirect(url_for('products'))
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error: {str(e)}', 'error')
         
-        flash('Produk berhasil ditambahkan dengan informasi lengkap!', 'success')
-        return redirect(url_for('products'))
+        context['summary'], context['rows'] = preview_reprice(params)
     
-    return render_template('products/add.html', generated_id=generate_product_id())
+    return render_template('products/reprice.html', **context)
 
-# Inventory Management Routes
 @app.route('/inventory')
 @manager_required
 def inventory():
     """Inventory list"""
-    items = InventoryItem.query.join(Product).all()
-    return render_template('inventory/list.html', items=items, format_currency=format_currency)
+    items, next_cursor = get_inventory_page(request.args)
+    
+    next_url = None
+    if next_cursor:
+        page_args = {key: value for key, value in request.args.items() if key != 'after'}
+        next_url = url_for('inventory', after=next_cursor, **page_args)
+    
+    return render_template('inventory/list.html', items=items, next_url=next_url,
+                           summary=get_inventory_summary(), format_currency=format_currency)
+
+@app.route('/inventory/reorder')
+@manager_required
+def reorder_queue():
+    """Low stock products and items grouped by supplier, with quantities to refill up to maximum stock"""
+    suppliers = OrderedDict()
+    for entry in sorted(get_low_stock_entries(), key=lambda entry: ((entry['supplier'] or '').lower(), entry['name'])):
+        group = suppliers.setdefault(entry['supplier'] or 'Tanpa Supplier', {'entries': [], 'total_cost': 0})
+        group['entries'].append(entry)
+        group['total_cost'] += entry['estimated_cost']
+    
+    return render_template('inventory/reorder.html', suppliers=suppliers)
+
+@app.route('/inventory/stock-take', methods=['GET', 'POST'])
+@manager_required
+def stock_takes():
+    """Stock take sessions, POST starts a new one"""
+    if request.method == 'POST':
+        stock_take = StockTake(notes=request.form.get('notes', '').strip() or None, created_by=session.get('user_id'))
+        db.session.add(stock_take)
+        db.session.commit()
+        return redirect(url_for('stock_take', stock_take_id=stock_take.id))
+    
+    count_totals = db.session.query(
+        StockTakeCount.stock_take_id,
+        db.func.count(StockTakeCount.id).label('entries'),
+        db.func.sum(StockTakeCount.counted).label('units')
+    ).group_by(StockTakeCount.stock_take_id).subquery()
+    sessions = db.session.query(StockTake, count_totals.c.entries, count_totals.c.units).outerjoin(
+        count_totals, count_totals.c.stock_take_id == StockTake.id
+    ).options(db.joinedload(StockTake.creator)).order_by(StockTake.created_at.desc()).limit(50).all()
+    
+    return render_template('inventory/stock_takes.html', sessions=sessions)
+
+@app.route('/inventory/stock-take/<int:stock_take_id>')
+@manager_required
+def stock_take(stock_take_id):
+    """Stock take session with the variance report"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    variances = get_stock_take_variances(stock_take.id)
+    summary = {
+        'counted_entries': len(variances),
+        'mismatches': sum(1 for entry in variances if entry['variance']),
+        'surplus_value': sum(entry['variance_value'] for entry in variances if entry['variance_value'] > 0),
+        'shortage_value': sum(entry['variance_value'] for entry in variances if entry['variance_value'] < 0)
+    }
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'status': stock_take.status, 'summary': summary, 'variances': variances})
+    
+    return render_template('inventory/stock_take.html', stock_take=stock_take, variances=variances, summary=summary)
+
+@app.route('/inventory/stock-take/<int:stock_take_id>/scan', methods=['POST'])
+@manager_required
+def stock_take_scan(stock_take_id):
+    """Record scanned counts, JSON {"scans": [{"code", "quantity"}], "replace"} or a single form entry"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    if stock_take.status != 'open':
+        return jsonify({'success': False, 'message': 'Stock opname sudah ditutup'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    scans = data.get('scans')
+    if scans is None:
+        scans = [{'code': request.form.get('code', ''), 'quantity': request.form.get('quantity', 1)}]
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'success': False, 'message': 'Tidak ada kode yang dipindai'}), 400
+    if len(scans) > MAX_SCAN_CODES:
+        return jsonify({'success': False, 'message': f'Maksimal {MAX_SCAN_CODES} kode per permintaan'}), 400
+    
+    try:
+        entries = [(str(scan['code']).strip(), int(scan.get('quantity', 1))) for scan in scans]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Format data scan tidak valid'}), 400
+    if any(not code or quantity < 0 for code, quantity in entries):
+        return jsonify({'success': False, 'message': 'Kode wajib diisi dan jumlah tidak boleh negatif'}), 400
+    
+    replace = bool(data.get('replace', request.form.get('replace')))
+    return jsonify({'success': True, 'results': record_stock_take_counts(stock_take.id, entries, replace=replace)})
+
+@app.route('/inventory/stock-take/<int:stock_take_id>/apply', methods=['POST'])
+@manager_required
+def apply_stock_take_route(stock_take_id):
+    """Write every counted stock and its ledger entry in one transaction"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    if stock_take.status != 'open':
+        flash('Stock opname ini sudah ditutup!', 'error')
+        return redirect(url_for('stock_take', stock_take_id=stock_take.id))
+    
+    try:
+        adjusted = apply_stock_take(stock_take, user_id=session.get('user_id'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'error')
+        return redirect(url_for('stock_take', stock_take_id=stock_take.id))
+    
+    invalidate_scan_index()
+    invalidate_dashboard_stats()
+    flash(f'Stock opname diterapkan, {adjusted} stok disesuaikan!', 'success')
+    return redirect(url_for('stock_take', stock_take_id=stock_take.id))
+
+@app.route('/inventory/stock-take/<int:stock_take_id>/cancel', methods=['POST'])
+@manager_required
+def cancel_stock_take(stock_take_id):
+    """Close an open stock take without changing stock"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    if stock_take.status == 'open':
+        stock_take.status = 'cancelled'
+        db.session.commit()
+        flash('Stock opname dibatalkan.', 'info')
+    return redirect(url_for('stock_takes'))
 
 @app.route('/inventory/add', methods=['GET', 'POST'])
 @manager_required
@@ -1393,7 +3557,13 @@ def add_inventory_item():
             minimum_stock=minimum_stock
         )
         db.session.add(item)
+        db.session.flush()
+        record_stock_movements([
+            {'inventory_item_id': item.id, 'delta': initial_stock, 'reason': 'initial', 'reference': 'add_inventory_item'}
+        ], user_id=session.get('user_id'))
         db.session.commit()
+        invalidate_scan_index()
+        invalidate_dashboard_stats()
         
         flash('Item inventory berhasil ditambahkan!', 'success')
         return redirect(url_for('inventory'))
@@ -1414,20 +3584,28 @@ def update_inventory_stock(item_id):
         flash('Jumlah harus lebih dari 0!', 'error')
         return redirect(url_for('inventory'))
     
+    reference = notes[:100] or 'update_inventory_stock'
     if action == 'add':
         item.current_stock += quantity
+        record_stock_movements([
+            {'inventory_item_id': item.id, 'delta': quantity, 'reason': 'purchase', 'reference': reference}
+        ], user_id=session.get('user_id'))
         flash(f'Berhasil menambah {quantity} stok untuk {item.product.name}!', 'success')
     elif action == 'subtract':
         if quantity > item.current_stock:
             flash(f'Stok tidak mencukupi! Stok saat ini: {item.current_stock}', 'error')
             return redirect(url_for('inventory'))
         item.current_stock -= quantity
+        record_stock_movements([
+            {'inventory_item_id': item.id, 'delta': -quantity, 'reason': 'adjustment', 'reference': reference}
+        ], user_id=session.get('user_id'))
         flash(f'Berhasil mengurangi {quantity} stok untuk {item.product.name}!', 'success')
     elif action == 'set_minimum':
         item.minimum_stock = quantity
         flash(f'Berhasil mengatur minimum stok {item.product.name} menjadi {quantity}!', 'success')
     
     db.session.commit()
+    invalidate_dashboard_stats()
     return redirect(url_for('inventory'))
 
 # Savings Management Routes
@@ -1436,36 +3614,22 @@ def update_inventory_stock(item_id):
 def savings():
     """Savings dashboard"""
     search_query = request.args.get('search', '').strip()
+    savers, next_cursor = get_saver_page(request.args)
     
-    savers_query = Saver.query
-    if search_query:
-        savers_query = savers_query.filter(Saver.name.contains(search_query))
+    next_url = None
+    if next_cursor:
+        page_args = {key: value for key, value in request.args.items() if key != 'after'}
+        next_url = url_for('savings', after=next_cursor, **page_args)
     
-    savers = savers_query.order_by(Saver.name).all()
-    
-    recent_transactions = db.session.query(SavingsTransaction).join(Saver).order_by(
-        SavingsTransaction.created_at.desc()
-    ).limit(20).all()
-    
-    total_deposits = db.session.query(db.func.sum(SavingsTransaction.amount)).filter(
-        SavingsTransaction.type == 'deposit'
-    ).scalar() or 0
-    
-    total_withdrawals = db.session.query(db.func.sum(SavingsTransaction.amount)).filter(
-        SavingsTransaction.type == 'withdrawal'
-    ).scalar() or 0
-    
-    stats = {
-        'total_savers': len(savers),
-        'total_balance': total_deposits - total_withdrawals,
-        'total_deposits': total_deposits,
-        'total_withdrawals': total_withdrawals
-    }
+    recent_transactions = db.session.query(SavingsTransaction).join(SavingsTransaction.saver).options(
+        db.contains_eager(SavingsTransaction.saver)
+    ).order_by(SavingsTransaction.created_at.desc()).limit(20).all()
     
     return render_template('savings/dashboard.html', 
                          savers=savers, 
+                         next_url=next_url,
                          recent_transactions=recent_transactions,
-                         stats=stats,
+                         stats=get_savings_summary(),
                          search_query=search_query,
                          format_currency=format_currency)
 
@@ -1490,20 +3654,16 @@ def savings_deposit():
             db.session.add(saver)
             db.session.flush()
         
-        current_balance = saver.get_balance()
-        new_balance = current_balance + amount
-        
-        transaction = SavingsTransaction(
-            saver_id=saver.id,
-            date=entry_date,
-            amount=amount,
-            type='deposit',
-            description=description or 'Setoran tabungan',
-            balance_after=new_balance
-        )
+        try:
+            transaction = apply_savings_transaction(saver, amount, 'deposit', entry_date,
+                                                    description or 'Setoran tabungan')
+        except SavingsError as e:
+            db.session.rollback()
+            flash(e.message, 'error')
+            return redirect(url_for('savings_deposit'))
         
-        db.session.add(transaction)
         db.session.commit()
+        invalidate_dashboard_stats()
         
         flash(f'Berhasil menyetor {format_currency(amount)} untuk {saver_name}!', 'success')
         
@@ -1533,24 +3693,16 @@ def savings_withdraw():
             flash('Penabung tidak ditemukan!', 'error')
             return redirect(url_for('savings_withdraw'))
         
-        current_balance = saver.get_balance()
-        if amount > current_balance:
-            flash('Saldo tidak mencukupi!', 'error')
+        try:
+            transaction = apply_savings_transaction(saver, amount, 'withdrawal', entry_date,
+                                                    description or 'Penarikan tabungan')
+        except SavingsError as e:
+            db.session.rollback()
+            flash(e.message, 'error')
             return redirect(url_for('savings_withdraw'))
         
-        new_balance = current_balance - amount
-        
-        transaction = SavingsTransaction(
-            saver_id=saver.id,
-            date=entry_date,
-            amount=amount,
-            type='withdrawal',
-            description=description or 'Penarikan tabungan',
-            balance_after=new_balance
-        )
-        
-        db.session.add(transaction)
         db.session.commit()
+        invalidate_dashboard_stats()
         
         flash(f'Berhasil menarik {format_currency(amount)} untuk {saver_name}!', 'success')
         
@@ -1567,12 +3719,20 @@ def savings_withdraw():
 def savings_statement(saver_id):
     """Display savings statement (rekening koran)"""
     saver = Saver.query.get_or_404(saver_id)
-    transactions = SavingsTransaction.query.filter_by(saver_id=saver_id).order_by(SavingsTransaction.date.desc(), SavingsTransaction.id.desc()).all()
+    try:
+        start_date, end_date = parse_statement_period(request.args)
+    except ValueError:
+        flash('Periode tanggal tidak valid!', 'error')
+        start_date, end_date = parse_statement_period({})
+    
+    statement = get_savings_statement(saver, start_date, end_date, page=request.args.get('page', 1, type=int))
     business = BusinessSettings.query.first()
     
     return render_template('savings/statement.html', 
                          saver=saver, 
-                         transactions=transactions,
+                         statement=statement,
+                         start_date=start_date,
+                         end_date=end_date,
                          business=business,
                          current_datetime=datetime.now(),
                          format_currency=format_currency,
@@ -1583,15 +3743,20 @@ def savings_statement(saver_id):
 def savings_statement_pdf(saver_id):
     """Generate savings statement PDF"""
     saver = Saver.query.get_or_404(saver_id)
+    try:
+        start_date, end_date = parse_statement_period(request.args)
+    except ValueError:
+        flash('Periode tanggal tidak valid!', 'error')
+        return redirect(url_for('savings_statement', saver_id=saver.id))
     
     if REPORTLAB_AVAILABLE:
-        pdf_buffer = generate_savings_statement_pdf(saver)
+        pdf_buffer = generate_savings_statement_pdf(saver, start_date, end_date)
         if pdf_buffer:
             return send_file(
                 pdf_buffer,
                 mimetype='application/pdf',
                 as_attachment=True,
-                download_name=f'rekening_koran_{saver.name}_{datetime.now().strftime("%Y%m%d")}.pdf'
+                download_name=f'rekening_koran_{saver.name}_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.pdf'
             )
     
     flash('PDF generation tidak tersedia!', 'error')
@@ -1606,98 +3771,8 @@ def savings_receipt(transaction_id):
     # If requesting PDF download
     if request.args.get('format') == 'pdf':
         if REPORTLAB_AVAILABLE:
-                # Create real bank-style savings receipt
-                buffer = io.BytesIO()
-                doc = SimpleDocTemplate(buffer, pagesize=(200, 600), topMargin=10, bottomMargin=10, leftMargin=10, rightMargin=10)
-                styles = getSampleStyleSheet()
-                
-                # ATM/Bank receipt styles
-                atm_style = ParagraphStyle(
-                    'ATM',
-                    parent=styles['Normal'],
-                    fontSize=8,
-                    alignment=1,  # Center
-                    fontName='Courier'
-                )
-                
-                atm_bold = ParagraphStyle(
-                    'ATMBold',
-                    parent=atm_style,
-                    fontName='Courier-Bold',
-                    fontSize=9
-                )
-                
-                atm_small = ParagraphStyle(
-                    'ATMSmall',
-                    parent=atm_style,
-                    fontSize=7
-                )
-                
-                elements = []
-                
-                # Bank header
-                business = BusinessSettings.query.first()
-                if business:
-                    bank_name = business.business_name.upper()
-                    elements.append(Paragraph(bank_name, atm_bold))
-                    elements.append(Paragraph("LAYANAN TABUNGAN", atm_style))
-                    
-                    if business.address:
-                        # Format address for ATM receipt style
-                        address_short = business.address[:35] + "..." if len(business.address) > 35 else business.address
-                        elements.append(Paragraph(address_short, atm_small))
-                    
-                    if business.phone:
-                        elements.append(Paragraph(f"Telp: {business.phone}", atm_small))
-                else:
-                    elements.append(Paragraph("BANK FAJARMANDIRI", atm_bold))
-                    elements.append(Paragraph("LAYANAN TABUNGAN", atm_style))
-                    elements.append(Paragraph("Kec. Lembang, Bandung Barat", atm_small))
-                
-                elements.append(Paragraph("=" * 35, atm_small))
-                
-                # Transaction details - Bank style
-                transaction_type = 'SETORAN' if transaction.type == 'deposit' else 'PENARIKAN'
-                elements.append(Paragraph(f"TRANSAKSI {transaction_type}", atm_bold))
-                elements.append(Paragraph("=" * 35, atm_small))
-                
-                # Account info
-                elements.append(Paragraph(f"NAMA     : {transaction.saver.name.upper()}", atm_small))
-                elements.append(Paragraph(f"NO.REF   : {str(transaction.id).zfill(8)}", atm_small))
-                elements.append(Paragraph(f"TANGGAL  : {transaction.date.strftime('%d/%m/%Y')}", atm_small))
-                elements.append(Paragraph(f"WAKTU    : {transaction.created_at.strftime('%H:%M:%S')}", atm_small))
-                
-                elements.append(Paragraph("-" * 35, atm_small))
-                
-                # Transaction amount
-                elements.append(Paragraph(f"NOMINAL  : {format_currency(transaction.amount)}", atm_style))
-                elements.append(Paragraph(f"SALDO    : {format_currency(transaction.balance_after)}", atm_bold))
-                
-                if transaction.description:
-                    elements.append(Paragraph(f"KET      : {transaction.description[:25]}", atm_small))
-                
-                elements.append(Paragraph("=" * 35, atm_small))
-                
-                # Status
-                elements.append(Paragraph("TRANSAKSI BERHASIL", atm_bold))
-                elements.append(Paragraph("*** SIMPAN STRUK INI ***", atm_style))
-                elements.append(Paragraph("SEBAGAI BUKTI TRANSAKSI", atm_small))
-                
-                elements.append(Paragraph("-" * 35, atm_small))
-                
-                # Footer
-                elements.append(Paragraph("TERIMA KASIH", atm_style))
-                elements.append(Paragraph("TELAH MENABUNG", atm_small))
-                
-                if business and business.phone:
-                    elements.append(Paragraph(f"Info: {business.phone}", atm_small))
-                
-                # Print time
-                elements.append(Paragraph(f"Print: {datetime.now().strftime('%d/%m/%y %H:%M')}", atm_small))
-                
-                doc.build(elements)
-                buffer.seek(0)
-                
+            buffer = generate_savings_receipt_pdf(transaction)
+            if buffer:
                 return send_file(
                     buffer,
                     mimetype='application/pdf',
@@ -1716,17 +3791,56 @@ def savings_receipt(transaction_id):
                          format_currency=format_currency,
                          datetime=datetime)
 
+@app.route('/savings/receipt/<int:transaction_id>.escpos')
+@login_required
+def savings_receipt_escpos(transaction_id):
+    """Savings transaction receipt as raw ESC/POS bytes for thermal printers"""
+    transaction = SavingsTransaction.query.get_or_404(transaction_id)
+    return send_file(
+        io.BytesIO(render_receipt_escpos(build_savings_receipt_lines(transaction))),
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'struk_tabungan_{transaction.id}.escpos'
+    )
+
 # Cashier/POS Routes
 @app.route('/pos')
 @cashier_access
 def pos():
-    """POS interface"""
-    # Get products directly from Product table with stock > 0
-    products = Product.query.filter(Product.current_stock > 0, Product.is_active == True).all()
+    """POS interface, the catalog is loaded and kept up to date by /pos/catalog"""
+    return render_template('pos/interface.html')
+
+@app.route('/pos/catalog')
+@login_required
+def pos_catalog():
+    """POS catalog, full when since=0 or only products changed after version `since`"""
+    since = request.args.get('since', 0, type=int)
+    version = get_catalog_version()
+    if since < 0 or since > version or since < get_catalog_pruned_version():
+        # Unknown version (e.g. database restored), or deletes since then were pruned: send the full catalog
+        since = 0
+    
+    etag = f'catalog-{version}-{since}'
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    query = db.session.query(
+        Product.id, Product.name, Product.barcode, Product.qr_code,
+        Product.selling_price, Product.current_stock, Product.unit, Product.is_active
+    )
+    if since:
+        query = query.filter(Product.catalog_version > since)
+        deleted = [row.product_id for row in db.session.query(CatalogDeletion.product_id).filter(
+            CatalogDeletion.version > since
+        )]
+    else:
+        query = query.filter(Product.current_stock > 0, Product.is_active == True)
+        deleted = []
     
-    # Convert to dict format for JSON serialization
     items = []
-    for product in products:
+    for product in query:
         items.append({
             'id': product.id,
             'name': product.name,
@@ -1734,33 +3848,36 @@ def pos():
             'qr_code': product.qr_code,
             'selling_price': product.selling_price,
             'current_stock': product.current_stock,
-            'unit': product.unit or 'pcs'
+            'unit': product.unit or 'pcs',
+            'is_active': bool(product.is_active)
         })
     
-    return render_template('pos/interface.html', items=items)
+    response = jsonify({
+        'version': version,
+        'full': since == 0,
+        'items': items,
+        'deleted': deleted
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/pos/search')
 @login_required
 def pos_search():
     """Search products for POS"""
-    query = request.args.get('q', '').lower()
-    products = Product.query.filter(
-        Product.current_stock > 0,
-        Product.is_active == True
-    ).all()
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', PRODUCT_SEARCH_DEFAULT_LIMIT, type=int)
     
     results = []
-    for product in products:
-        if (query in product.id.lower() or 
-            query in product.name.lower() or
-            (product.barcode and query in product.barcode.lower())):
-            results.append({
-                'id': product.id,
-                'name': product.name,
-                'barcode': product.barcode,
-                'selling_price': product.selling_price,
-                'current_stock': product.current_stock
-            })
+    for product in search_products(query, limit):
+        results.append({
+            'id': product.id,
+            'name': product.name,
+            'barcode': product.barcode,
+            'selling_price': product.selling_price,
+            'current_stock': product.current_stock
+        })
     
     return jsonify(results)
 
@@ -1768,27 +3885,41 @@ def pos_search():
 @login_required
 def cashier_search_item():
     """Search items for cashier - POS compatible format"""
-    query = request.args.get('q', '').lower()
-    products = Product.query.filter(
-        Product.current_stock > 0,
-        Product.is_active == True
-    ).all()
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', PRODUCT_SEARCH_DEFAULT_LIMIT, type=int)
     
     results = []
-    for product in products:
-        if (query in product.id.lower() or 
-            query in product.name.lower() or
-            (product.barcode and query in product.barcode.lower())):
-            results.append({
-                'kode': product.id,
-                'nama': product.name,
-                'harga_jual': product.selling_price,
-                'stok_akhir': product.current_stock,
-                'barcode': product.barcode or product.id
-            })
+    for product in search_products(query, limit):
+        results.append({
+            'kode': product.id,
+            'nama': product.name,
+            'harga_jual': product.selling_price,
+            'stok_akhir': product.current_stock,
+            'barcode': product.barcode or product.id
+        })
     
     return jsonify(results)
 
+@app.route('/cashier/scan', methods=['GET', 'POST'])
+@login_required
+def cashier_scan():
+    """Exact lookup of scanned codes, one code via ?code= or a burst via JSON codes"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        codes = data.get('codes', [])
+        if not isinstance(codes, list) or not codes:
+            return jsonify({'success': False, 'message': 'Tidak ada kode untuk dicari!'})
+        if len(codes) > MAX_SCAN_CODES:
+            return jsonify({'success': False, 'message': f'Maksimal {MAX_SCAN_CODES} kode per permintaan!'})
+        return jsonify({'success': True, 'results': lookup_scan_codes(codes)})
+    
+    code = request.args.get('code', '').strip()
+    if not code:
+        return jsonify({'success': False, 'message': 'Kode kosong!'})
+    
+    result = lookup_scan_codes([code])[0]
+    return jsonify({'success': True, **result})
+
 @app.route('/pos/process_sale', methods=['POST'])
 @login_required
 def process_sale():
@@ -1797,178 +3928,254 @@ def process_sale():
     cart_items = data.get('items', [])
     payment_amount = data.get('payment_amount', 0)
     
-    if not cart_items:
-        return jsonify({'success': False, 'message': 'Keranjang kosong!'})
-    
-    transaction_items = []
-    total_amount = 0
-    total_profit = 0
-    
     try:
-        for cart_item in cart_items:
-            product_id = cart_item['id']
-            quantity = cart_item['quantity']
-            
-            # Get product directly from Product table
-            product = Product.query.get(product_id)
-            if not product or product.current_stock < quantity:
-                return jsonify({'success': False, 'message': f'Stok tidak mencukupi untuk {product.name if product else "produk tidak ditemukan"}!'})
-            
-            subtotal = product.selling_price * quantity
-            profit = (product.selling_price - product.purchase_price) * quantity
-            
-            # Update product stock
-            product.current_stock -= quantity
-            
-            # Update product sales statistics
-            product.total_sold += quantity
-            product.total_revenue += subtotal
-            product.profit = product.calculate_profit()
-            
-            transaction_items.append({
-                'id': product.id,
-                'name': product.name,
-                'selling_price': product.selling_price,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            
-            total_amount += subtotal
-            total_profit += profit
-        
-        if payment_amount < total_amount:
-            return jsonify({'success': False, 'message': 'Jumlah pembayaran kurang!'})
-        
-        change = payment_amount - total_amount
-        
-        # Save transaction
-        transaction = CashierTransaction(
-            timestamp=datetime.now(),
-            items=json.dumps(transaction_items),
-            total=total_amount,
-            profit=total_profit,
-            payment_amount=payment_amount,
-            change_amount=change,
-            cashier_id=session['user_id']
-        )
-        
-        db.session.add(transaction)
+        transaction, transaction_items = apply_sale(cart_items, payment_amount, session['user_id'])
         db.session.commit()
+        invalidate_dashboard_stats()
+        schedule_receipt_render([transaction.id])
         
         return jsonify({
             'success': True,
             'message': 'Transaksi berhasil!',
             'transaction_id': transaction.id,
-            'total': total_amount,
+            'total': transaction.total,
             'payment_amount': payment_amount,
-            'change': change
+            'change': transaction.change_amount
         })
         
+    except SaleError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': e.message, 'failed_items': e.failed_items})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+def _duplicate_sale_response(transaction_id):
+    """Response for a sale whose idempotency key was already recorded"""
+    transaction = db.session.get(CashierTransaction, transaction_id)
+    return jsonify({
+        'success': True,
+        'message': 'Transaksi sudah tercatat.',
+        'duplicate': True,
+        'transaction_id': transaction.id,
+        'total': transaction.total,
+        'payment_amount': transaction.payment_amount,
+        'change': transaction.change_amount,
+        'items': json.loads(transaction.items),
+        'timestamp': transaction.timestamp.strftime('%d/%m/%Y %H:%M:%S')
+    })
+
 @app.route('/cashier/process_sale', methods=['POST'])
 @login_required
 def cashier_process_sale():
-    """Process sale transaction - cashier compatible format"""
+    """Process sale transaction - cashier compatible format
+    
+    The terminal sends the idempotency key it will reuse if the sale has to
+    be queued offline, so a sale whose response was lost syncs as a duplicate.
+    """
     data = request.get_json()
     cart_items = data.get('items', [])
     payment_amount = data.get('payment_amount', 0)
+    idempotency_key = str(data.get('idempotency_key') or '')
     
-    if not cart_items:
-        return jsonify({'success': False, 'message': 'Keranjang kosong!'})
-    
-    transaction_items = []
-    total_amount = 0
-    total_profit = 0
+    if len(idempotency_key) > 64:
+        return jsonify({'success': False, 'message': 'Idempotency key tidak valid!'})
+    if idempotency_key:
+        sync_key = db.session.get(SaleSyncKey, idempotency_key)
+        if sync_key:
+            return _duplicate_sale_response(sync_key.transaction_id)
     
     try:
-        for cart_item in cart_items:
-            # Handle both 'kode' and 'id' format
-            product_id = cart_item.get('kode') or cart_item.get('id')
-            quantity = cart_item['quantity']
-            
-            # Get product directly from Product table
-            product = Product.query.get(product_id)
-            if not product or product.current_stock < quantity:
-                return jsonify({'success': False, 'message': f'Stok tidak mencukupi untuk {product.name if product else "produk tidak ditemukan"}!'})
-            
-            subtotal = product.selling_price * quantity
-            profit = (product.selling_price - product.purchase_price) * quantity
-            
-            # Update product stock
-            product.current_stock -= quantity
-            
-            # Update product sales statistics
-            product.total_sold += quantity
-            product.total_revenue += subtotal
-            product.profit = product.calculate_profit()
-            
-            transaction_items.append({
-                'kode': product.id,
-                'nama': product.name,
-                'harga_jual': product.selling_price,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            
-            total_amount += subtotal
-            total_profit += profit
-        
-        if payment_amount < total_amount:
-            return jsonify({'success': False, 'message': 'Jumlah pembayaran kurang!'})
-        
-        change = payment_amount - total_amount
-        
-        # Save transaction
-        transaction = CashierTransaction(
-            timestamp=datetime.now(),
-            items=json.dumps(transaction_items),
-            total=total_amount,
-            profit=total_profit,
-            payment_amount=payment_amount,
-            change_amount=change,
-            cashier_id=session['user_id']
-        )
-        
-        db.session.add(transaction)
+        transaction, transaction_items = apply_sale(cart_items, payment_amount, session['user_id'], item_format='cashier')
+        if idempotency_key:
+            db.session.add(SaleSyncKey(key=idempotency_key, transaction_id=transaction.id))
         db.session.commit()
+        invalidate_dashboard_stats()
+        schedule_receipt_render([transaction.id])
         
         return jsonify({
             'success': True,
             'message': 'Transaksi berhasil!',
             'transaction_id': transaction.id,
-            'total': total_amount,
+            'total': transaction.total,
             'payment_amount': payment_amount,
-            'change': change,
+            'change': transaction.change_amount,
             'items': transaction_items,
             'timestamp': transaction.timestamp.strftime('%d/%m/%Y %H:%M:%S')
         })
         
+    except SaleError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': e.message, 'failed_items': e.failed_items})
+    except IntegrityError as e:
+        # A concurrent request recorded the same key first, this sale was rolled back
+        db.session.rollback()
+        sync_key = db.session.get(SaleSyncKey, idempotency_key) if idempotency_key else None
+        if sync_key:
+            return _duplicate_sale_response(sync_key.transaction_id)
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+MAX_SYNC_BATCH_SIZE = 500
+
+def parse_client_timestamp(value):
+    """Parse an ISO timestamp sent by a POS terminal into local naive datetime"""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def _synced_sale_error(sale):
+    """Return a message when a queued sale is malformed, None when it can be applied"""
+    if not isinstance(sale, dict):
+        return 'Format transaksi tidak valid!'
+    items = sale.get('items')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return 'Format item transaksi tidak valid!'
+    payment_amount = sale.get('payment_amount', 0)
+    if isinstance(payment_amount, bool) or not isinstance(payment_amount, (int, float)):
+        return 'Jumlah pembayaran tidak valid!'
+    return None
+
+@app.route('/cashier/sync_sales', methods=['POST'])
+@login_required
+def cashier_sync_sales():
+    """Sync a batch of queued sales from an offline POS terminal
+    
+    Each sale is applied in its own savepoint together with its idempotency
+    key, so one bad sale is reported as failed without losing the others.
+    """
+    data = request.get_json(silent=True) or {}
+    sales = data.get('sales', [])
+    
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'success': False, 'message': 'Tidak ada transaksi untuk disinkronkan!'})
+    if len(sales) > MAX_SYNC_BATCH_SIZE:
+        return jsonify({'success': False, 'message': f'Maksimal {MAX_SYNC_BATCH_SIZE} transaksi per sinkronisasi!'})
+    
+    keys = [str(sale.get('idempotency_key') or '') if isinstance(sale, dict) else '' for sale in sales]
+    existing_keys = {
+        sync_key.key: sync_key.transaction_id
+        for sync_key in SaleSyncKey.query.filter(SaleSyncKey.key.in_([key for key in keys if key])).all()
+    }
+    
+    results = []
+    created_ids = []
+    try:
+        for sale, key in zip(sales, keys):
+            if not key or len(key) > 64:
+                results.append({'idempotency_key': key, 'status': 'failed',
+                                'message': 'Idempotency key tidak valid!'})
+                continue
+            
+            if key in existing_keys:
+                results.append({'idempotency_key': key, 'status': 'duplicate',
+                                'transaction_id': existing_keys[key]})
+                continue
+            
+            error = _synced_sale_error(sale)
+            if error:
+                results.append({'idempotency_key': key, 'status': 'failed', 'message': error})
+                continue
+            
+            savepoint = db.session.begin_nested()
+            try:
+                transaction, transaction_items = apply_sale(
+                    sale['items'],
+                    sale.get('payment_amount', 0),
+                    session['user_id'],
+                    item_format='cashier',
+                    timestamp=parse_client_timestamp(sale.get('timestamp'))
+                )
+                db.session.add(SaleSyncKey(key=key, transaction_id=transaction.id))
+                db.session.flush()
+                savepoint.commit()
+            except SaleError as e:
+                savepoint.rollback()
+                results.append({'idempotency_key': key, 'status': 'failed',
+                                'message': e.message, 'failed_items': e.failed_items})
+                continue
+            except IntegrityError:
+                # Another request recorded the same key while this one was applying it
+                savepoint.rollback()
+                sync_key = db.session.get(SaleSyncKey, key)
+                results.append({'idempotency_key': key, 'status': 'duplicate',
+                                'transaction_id': sync_key.transaction_id if sync_key else None})
+                continue
+            except Exception as e:
+                savepoint.rollback()
+                results.append({'idempotency_key': key, 'status': 'failed',
+                                'message': f'Error: {str(e)}'})
+                continue
+            
+            existing_keys[key] = transaction.id
+            created_ids.append(transaction.id)
+            results.append({'idempotency_key': key, 'status': 'created',
+                            'transaction_id': transaction.id,
+                            'total': transaction.total,
+                            'change': transaction.change_amount})
+        
+        db.session.commit()
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+    
+    if created_ids:
+        invalidate_dashboard_stats()
+        schedule_receipt_render(created_ids)
+    
+    return jsonify({
+        'success': True,
+        'created': len(created_ids),
+        'results': results
+    })
 
 @app.route('/pos/receipt/<int:transaction_id>')
 @login_required
 def print_receipt(transaction_id):
-    """Generate receipt PDF"""
-    transaction = CashierTransaction.query.get_or_404(transaction_id)
+    """Generate receipt PDF, served from the pre-rendered receipt cache when available"""
+    key = receipt_cache_key(transaction_id)
+    pdf_data = receipt_cache.get(key)
     
-    if REPORTLAB_AVAILABLE:
+    if pdf_data is None and REPORTLAB_AVAILABLE:
+        transaction = CashierTransaction.query.get_or_404(transaction_id)
         pdf_buffer = generate_receipt_pdf(transaction)
         if pdf_buffer:
-            return send_file(
-                pdf_buffer,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'struk_{transaction.id}_{datetime.now().strftime("%Y%m%d")}.pdf'
-            )
+            pdf_data = pdf_buffer.getvalue()
+            receipt_cache.put(key, pdf_data)
+    
+    if pdf_data is not None:
+        printed_at = datetime.now()
+        return send_file(
+            io.BytesIO(stamp_receipt_printed_at(pdf_data, printed_at)),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f'struk_{transaction_id}_{printed_at.strftime("%Y%m%d")}.pdf'
+        )
     
     flash('PDF generation tidak tersedia!', 'error')
     return redirect(url_for('pos'))
 
+@app.route('/pos/receipt/<int:transaction_id>.escpos')
+@login_required
+def print_receipt_escpos(transaction_id):
+    """Sale receipt as raw ESC/POS bytes for thermal printers"""
+    transaction = CashierTransaction.query.get_or_404(transaction_id)
+    return send_file(
+        io.BytesIO(render_receipt_escpos(build_sale_receipt_lines(transaction, printed_at=datetime.now()))),
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'struk_{transaction.id}.escpos'
+    )
+
 # Invoice Management Routes
 @app.route('/invoices')
 @cashier_access
@@ -2082,6 +4289,7 @@ def edit_invoice(invoice_id):
             invoice.total = subtotal + invoice.tax_amount
             
             db.session.commit()
+            invalidate_dashboard_stats()
             flash('Invoice berhasil diupdate!', 'success')
             return redirect(url_for('invoices'))
             
@@ -2165,6 +4373,7 @@ def create_invoice():
         invoice.total = subtotal + invoice.tax_amount
         
         db.session.commit()
+        invalidate_dashboard_stats()
         
         flash('Invoice berhasil dibuat!', 'success')
         return redirect(url_for('invoices'))
@@ -2196,6 +4405,7 @@ def customer_debts():
             debt.status = 'overdue'
     
     db.session.commit()
+    invalidate_dashboard_stats()
     
     return render_template('debts/list.html', debts=debts, search=search, status_filter=status_filter, format_currency=format_currency)
 
@@ -2233,6 +4443,7 @@ def add_customer_debt():
         
         db.session.add(debt)
         db.session.commit()
+        invalidate_dashboard_stats()
         
         flash('Hutang pelanggan berhasil ditambahkan!', 'success')
         return redirect(url_for('customer_debts'))
@@ -2273,6 +4484,7 @@ def pay_debt(debt_id):
     
     db.session.add(payment)
     db.session.commit()
+    invalidate_dashboard_stats()
     
     flash(f'Pembayaran {format_currency(payment_amount)} berhasil dicatat!', 'success')
     return redirect(url_for('customer_debts'))
@@ -2329,6 +4541,7 @@ def business_settings():
         business.updated_at = datetime.utcnow()
         
         db.session.commit()
+        receipt_cache.clear()
         flash('Pengaturan bisnis berhasil diperbarui!', 'success')
         return redirect(url_for('business_settings'))
     
@@ -2358,33 +4571,21 @@ def admin_reports():
     today = datetime.now().date()
     start_date = today - timedelta(days=30)
     
-    transactions = CashierTransaction.query.filter(
-        CashierTransaction.timestamp >= start_date
-    ).all()
-    
-    total_revenue = sum(t.total for t in transactions)
-    total_profit = sum(t.profit for t in transactions)
+    summary = get_sales_summary(start_date)
+    total_revenue = summary['revenue']
+    total_profit = summary['profit']
     
     # Best selling items
-    item_sales = {}
-    for transaction in transactions:
-        items = json.loads(transaction.items)
-        for item in items:
-            if item['name'] in item_sales:
-                item_sales[item['name']] += item['quantity']
-            else:
-                item_sales[item['name']] = item['quantity']
-    
-    sorted_items = sorted(item_sales.items(), key=lambda x: x[1], reverse=True)[:5]
+    sorted_items = get_best_selling_items(start_date, limit=5)
     
     # Low stock items
-    low_stock_items = InventoryItem.query.filter(InventoryItem.current_stock <= InventoryItem.minimum_stock).all()
+    low_stock_items = get_low_stock_entries()
     
     stats = {
         'total_revenue': total_revenue,
         'total_profit': total_profit,
         'total_loss': abs(total_revenue - total_profit) if total_profit < 0 else 0,
-        'total_transactions': len(transactions),
+        'total_transactions': summary['txn_count'],
         'best_selling': sorted_items,
         'low_stock_items': low_stock_items
     }
@@ -2395,6 +4596,118 @@ def admin_reports():
                          datetime=datetime,
                          timedelta=timedelta)
 
+# Data export: rows are streamed from the database cursor, memory stays flat for any table size
+EXPORT_YIELD_PER = 1000
+
+def _export_datasets():
+    """Export name -> (projection statement, date column used by the date-range filter)"""
+    return {
+        'products': (db.select(
+            Product.id, Product.name, Product.category, Product.brand, Product.supplier, Product.unit,
+            Product.purchase_price, Product.selling_price, Product.current_stock, Product.minimum_stock,
+            Product.maximum_stock, Product.total_sold, Product.total_revenue, Product.profit,
+            Product.is_active, Product.created_at
+        ).order_by(Product.id), Product.created_at),
+        'sales': (db.select(
+            CashierTransaction.id, CashierTransaction.timestamp, User.username.label('cashier'),
+            CashierTransaction.total, CashierTransaction.profit,
+            CashierTransaction.payment_amount, CashierTransaction.change_amount
+        ).outerjoin(User, User.id == CashierTransaction.cashier_id)
+         .order_by(CashierTransaction.timestamp, CashierTransaction.id), CashierTransaction.timestamp),
+        'sale_lines': (db.select(
+            SaleLine.transaction_id, CashierTransaction.timestamp, SaleLine.product_id, SaleLine.product_name,
+            SaleLine.quantity, SaleLine.unit_price, SaleLine.unit_cost, SaleLine.subtotal
+        ).join(CashierTransaction, CashierTransaction.id == SaleLine.transaction_id)
+         .order_by(CashierTransaction.timestamp, SaleLine.id), CashierTransaction.timestamp),
+        'savings': (db.select(
+            SavingsTransaction.id, SavingsTransaction.date, Saver.name.label('saver'), SavingsTransaction.type,
+            SavingsTransaction.amount, SavingsTransaction.balance_after, SavingsTransaction.description
+        ).join(Saver, Saver.id == SavingsTransaction.saver_id)
+         .order_by(SavingsTransaction.date, SavingsTransaction.id), SavingsTransaction.date),
+        'debts': (db.select(
+            CustomerDebt.id, Customer.name.label('customer'), CustomerDebt.invoice_number, CustomerDebt.description,
+            CustomerDebt.total_amount, CustomerDebt.paid_amount, CustomerDebt.remaining_amount,
+            CustomerDebt.due_date, CustomerDebt.status, CustomerDebt.created_at
+        ).join(Customer, Customer.id == CustomerDebt.customer_id)
+         .order_by(CustomerDebt.created_at, CustomerDebt.id), CustomerDebt.created_at),
+        'invoices': (db.select(
+            Invoice.id, Invoice.invoice_number, Invoice.client_name, Invoice.service_date, Invoice.issue_date,
+            Invoice.due_date, Invoice.status, Invoice.subtotal, Invoice.tax_rate, Invoice.tax_amount, Invoice.total
+        ).order_by(Invoice.issue_date, Invoice.id), Invoice.issue_date)
+    }
+
+def filter_by_date_range(statement, column, start_date=None, end_date=None):
+    """Restrict a statement to start_date..end_date inclusive, on a Date or DateTime column"""
+    if isinstance(column.type, db.DateTime):
+        if start_date:
+            statement = statement.where(column >= datetime.combine(start_date, datetime.min.time()))
+        if end_date:
+            statement = statement.where(column < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    else:
+        if start_date:
+            statement = statement.where(column >= start_date)
+        if end_date:
+            statement = statement.where(column <= end_date)
+    return statement
+
+def _export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def generate_export_rows(statement, export_format):
+    """Yield an export as CSV or JSON Lines text chunks, fetching EXPORT_YIELD_PER rows at a time"""
+    result = db.session.execute(statement, execution_options={'yield_per': EXPORT_YIELD_PER})
+    columns = list(result.keys())
+    
+    if export_format == 'jsonl':
+        for partition in result.partitions():
+            yield ''.join(
+                json.dumps(dict(zip(columns, map(_export_value, row))), ensure_ascii=False) + '\n'
+                for row in partition
+            )
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for partition in result.partitions():
+        writer.writerows([_export_value(value) for value in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route('/export/<dataset>')
+@manager_required
+def export_data(dataset):
+    """Stream products, sales, sale_lines, savings, debts or invoices as CSV (?format=jsonl for JSON Lines)"""
+    datasets = _export_datasets()
+    if dataset not in datasets:
+        flash('Jenis data export tidak dikenal!', 'error')
+        return redirect(url_for('admin_reports'))
+    
+    export_format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else None
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else None
+    except ValueError:
+        flash('Format tanggal tidak valid!', 'error')
+        return redirect(url_for('admin_reports'))
+    
+    statement, date_column = datasets[dataset]
+    statement = filter_by_date_range(statement, date_column, start_date, end_date)
+    
+    period = f"_{start_date or 'awal'}_{end_date or 'sekarang'}" if start_date or end_date else ''
+    filename = f"{dataset}{period}.{export_format}"
+    mimetype = 'application/x-ndjson' if export_format == 'jsonl' else 'text/csv'
+    
+    return Response(
+        stream_with_context(generate_export_rows(statement, export_format)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 # API Routes
 @app.route('/api/generate_barcode/<code>')
 def generate_barcode(code):
@@ -2434,9 +4747,8 @@ def generate_qrcode(code):
 
 @app.route('/api/generate_product_id')
 def api_generate_product_id():
-    """Generate new product ID via API"""
-    product_id = generate_product_id()
-    return jsonify({'product_id': product_id})
+    """Preview the next generated product ID; it is reserved only when a product is saved"""
+    return jsonify({'product_id': peek_product_id()})
 
 @app.route('/api/check_product_id/<product_id>')
 def check_product_id(product_id):
@@ -2458,6 +4770,8 @@ def toggle_product(product_id):
     product = Product.query.get_or_404(product_id)
     product.is_active = not product.is_active
     db.session.commit()
+    invalidate_scan_index()
+    invalidate_dashboard_stats()
     
     status = "diaktifkan" if product.is_active else "dinonaktifkan"
     flash(f'Produk {product.name} berhasil {status}!', 'success')
@@ -2477,6 +4791,8 @@ def delete_product(product_id):
     
     db.session.delete(product)
     db.session.commit()
+    invalidate_scan_index()
+    invalidate_dashboard_stats()
     
     flash(f'Produk {product_name} berhasil dihapus!', 'success')
     return redirect(url_for('products'))
@@ -2507,13 +4823,129 @@ def api_product_detail(product_id):
         }
     })
 
+API_PRODUCT_FIELDS = {
+    'id': Product.id,
+    'name': Product.name,
+    'description': Product.description,
+    'category': Product.category,
+    'brand': Product.brand,
+    'supplier': Product.supplier,
+    'barcode': Product.barcode,
+    'qr_code': Product.qr_code,
+    'unit': Product.unit,
+    'purchase_price': Product.purchase_price,
+    'selling_price': Product.selling_price,
+    'current_stock': Product.current_stock,
+    'minimum_stock': Product.minimum_stock,
+    'maximum_stock': Product.maximum_stock,
+    'profit': Product.profit,
+    'total_sold': Product.total_sold,
+    'total_revenue': Product.total_revenue,
+    'is_active': Product.is_active,
+    'updated_at': Product.updated_at
+}
+API_PRODUCT_DEFAULT_FIELDS = ('id', 'name', 'category', 'brand', 'unit', 'purchase_price',
+                              'selling_price', 'current_stock', 'is_active')
+MAX_API_PRODUCT_IDS = 200
+
+@app.route('/api/products')
+@login_required
+def api_products():
+    """Several products in one request: ?ids=A,B,C&fields=name,selling_price
+    
+    Only the requested columns are selected. The ETag changes whenever one of
+    the products is updated or deleted, so clients can revalidate cheaply.
+    """
+    product_ids = list(dict.fromkeys(code.strip() for code in request.args.get('ids', '').split(',') if code.strip()))
+    if not product_ids:
+        return jsonify({'success': False, 'message': 'Parameter ids wajib diisi'}), 400
+    if len(product_ids) > MAX_API_PRODUCT_IDS:
+        return jsonify({'success': False, 'message': f'Maksimal {MAX_API_PRODUCT_IDS} produk per permintaan'}), 400
+    
+    requested_fields = request.args.get('fields')
+    fields = [field.strip() for field in requested_fields.split(',') if field.strip()] if requested_fields else list(API_PRODUCT_DEFAULT_FIELDS)
+    unknown = [field for field in fields if field not in API_PRODUCT_FIELDS]
+    if unknown:
+        return jsonify({'success': False, 'message': f"Field tidak dikenal: {', '.join(unknown)}"}), 400
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    
+    found, last_updated = db.session.query(
+        db.func.count(Product.id), db.func.max(Product.updated_at)
+    ).filter(Product.id.in_(product_ids)).one()
+    
+    etag = hashlib.sha1(
+        f"{','.join(product_ids)}|{','.join(fields)}|{found}|{last_updated}".encode()
+    ).hexdigest()
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    rows = db.session.execute(
+        db.select(*[API_PRODUCT_FIELDS[field] for field in fields]).where(Product.id.in_(product_ids))
+    ).all()
+    by_id = {row.id: row for row in rows}
+    
+    products = []
+    for product_id in product_ids:
+        row = by_id.get(product_id)
+        if row:
+            products.append({
+                field: value.isoformat() if isinstance(value, datetime) else value
+                for field, value in zip(fields, row)
+            })
+    
+    response = jsonify({
+        'success': True,
+        'products': products,
+        'missing': [product_id for product_id in product_ids if product_id not in by_id]
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/stock_at')
+@manager_required
+def api_stock_at():
+    """Historical stock: ?product_id=... or ?item_id=..., and at=YYYY-MM-DD[THH:MM[:SS]] (end of day for dates)"""
+    product_id = request.args.get('product_id')
+    item_id = request.args.get('item_id', type=int)
+    if not product_id and item_id is None:
+        return jsonify({'success': False, 'message': 'Parameter product_id atau item_id wajib diisi'}), 400
+    
+    raw_at = request.args.get('at', '')
+    try:
+        at = datetime.fromisoformat(raw_at)
+        if 'T' not in raw_at and ' ' not in raw_at:
+            at = datetime.combine(at.date(), datetime.max.time())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Format waktu tidak valid'}), 400
+    
+    stock = get_stock_at(at, product_id=product_id, inventory_item_id=None if product_id else item_id)
+    return jsonify({
+        'success': stock is not None,
+        'product_id': product_id,
+        'item_id': item_id,
+        'at': at.isoformat(),
+        'stock': stock,
+        'message': None if stock is not None else 'Tidak ada data stok untuk waktu tersebut'
+    })
+
 @app.route('/api/saver_balance/<saver_name>')
 @login_required
 def get_saver_balance(saver_name):
-    """API endpoint to get saver balance"""
+    """API endpoint to get saver balance, or with ?as_of=YYYY-MM-DD the balance at the end of that day"""
     saver = Saver.query.filter_by(name=saver_name).first()
     if saver:
-        balance = saver.get_balance()
+        if request.args.get('as_of'):
+            try:
+                as_of = datetime.strptime(request.args['as_of'], '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'success': False, 'message': 'Format tanggal tidak valid (YYYY-MM-DD)'}), 400
+            balance = get_saver_balance_at(saver.id, as_of + timedelta(days=1))
+        else:
+            balance = saver.get_balance()
         return jsonify({
             'exists': True,
             'balance': balance,
@@ -2549,15 +4981,67 @@ def inject_common_functions():
         'timedelta': timedelta
     }
 
+# Columns added to existing tables after their first release
+SCHEMA_UPGRADES = {
+    'products': {
+        'catalog_version': 'INTEGER NOT NULL DEFAULT 0'
+    },
+    'savers': {
+        'balance': 'REAL NOT NULL DEFAULT 0'
+    }
+}
+
+SCHEMA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_products_catalog_version ON products (catalog_version)",
+    # Product list keyset pagination and filters
+    "CREATE INDEX IF NOT EXISTS ix_products_name_id ON products (name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_products_selling_price_id ON products (selling_price, id)",
+    "CREATE INDEX IF NOT EXISTS ix_products_current_stock_id ON products (current_stock, id)",
+    "CREATE INDEX IF NOT EXISTS ix_products_total_sold_id ON products (total_sold, id)",
+    "CREATE INDEX IF NOT EXISTS ix_products_total_revenue_id ON products (total_revenue, id)",
+    "CREATE INDEX IF NOT EXISTS ix_products_category ON products (category)",
+    "CREATE INDEX IF NOT EXISTS ix_products_brand ON products (brand)",
+    # Savings dashboard search and per-saver transaction lookups
+    "CREATE INDEX IF NOT EXISTS ix_savers_name_nocase ON savers (name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS ix_savers_phone ON savers (phone)",
+    "CREATE INDEX IF NOT EXISTS ix_savings_transactions_saver_date ON savings_transactions (saver_id, date, id)"
+]
+
+def upgrade_database_schema():
+    """Add columns and indexes that db.create_all() does not add to existing tables"""
+    try:
+        for table, columns in SCHEMA_UPGRADES.items():
+            existing_columns = [row[1] for row in db.session.execute(db.text(f"PRAGMA table_info({table})"))]
+            for column, definition in columns.items():
+                if column not in existing_columns:
+                    db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+                    print(f"Added column: {table}.{column}")
+        
+        for statement in SCHEMA_INDEXES:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Schema upgrade note: {e}")
+
 # Initialize database
 def init_database():
     """Initialize database and create admin user"""
     with app.app_context():
         try:
             db.create_all()
+            upgrade_database_schema()
             
             # Migrate existing data if needed
             migrate_existing_products()
+            backfill_sale_lines()
+            backfill_daily_sales()
+            backfill_saver_balances()
+            init_saver_balance_snapshots()
+            init_stock_snapshots()
+            init_low_stock_watchlist()
+            init_product_search_index()
+            init_catalog_versioning()
             
             # Create default admin user if not exists
             admin = User.query.filter_by(username='admin').first()
@@ -2591,6 +5075,173 @@ def init_database():
             except Exception as migration_error:
                 print(f"Migration error: {migration_error}")
 
+SALE_LINES_BACKFILL_COUNTER = 'sale_lines_backfill'
+
+def backfill_sale_lines():
+    """One-time backfill of sale_lines from the JSON items of older transactions
+    
+    The highest transaction id looked at is kept in the counters table, so
+    transactions with empty or unreadable items are not scanned on every boot.
+    """
+    try:
+        db.session.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_cashier_transactions_timestamp ON cashier_transactions (timestamp)"
+        ))
+        
+        backfilled_upto = db.session.execute(db.text(
+            "SELECT value FROM counters WHERE name = :name"
+        ), {'name': SALE_LINES_BACKFILL_COUNTER}).scalar() or 0
+        pending = CashierTransaction.query.filter(
+            CashierTransaction.id > backfilled_upto,
+            ~db.exists().where(SaleLine.transaction_id == CashierTransaction.id)
+        ).order_by(CashierTransaction.id).all()
+        if not pending:
+            db.session.commit()
+            return
+        
+        purchase_prices = dict(db.session.query(Product.id, Product.purchase_price).all())
+        rows = []
+        for transaction in pending:
+            try:
+                items = json.loads(transaction.items or '[]')
+            except ValueError:
+                continue
+            
+            for item in items:
+                # Handle both 'id/name' (POS) and 'kode/nama' (cashier) formats
+                product_id = item.get('id') or item.get('kode')
+                quantity = int(item.get('quantity') or 0)
+                unit_price = item.get('selling_price') or item.get('harga_jual') or 0
+                rows.append({
+                    'transaction_id': transaction.id,
+                    'product_id': product_id,
+                    'product_name': item.get('name') or item.get('nama'),
+                    'quantity': quantity,
+                    'unit_price': unit_price,
+                    # Historical cost is not stored in the JSON, use the current purchase price
+                    'unit_cost': purchase_prices.get(product_id) or 0,
+                    'subtotal': item.get('subtotal', unit_price * quantity)
+                })
+        
+        if rows:
+            db.session.execute(SaleLine.__table__.insert(), rows)
+        db.session.execute(db.text(
+            "INSERT INTO counters (name, value) VALUES (:name, :value) "
+            "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)"
+        ), {'name': SALE_LINES_BACKFILL_COUNTER, 'value': pending[-1].id})
+        db.session.commit()
+        print(f"Backfilled {len(rows)} sale lines from {len(pending)} transactions")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Sale lines backfill note: {e}")
+
+def backfill_daily_sales():
+    """Build the daily_sales rollup once for databases that predate it"""
+    try:
+        if DailySales.query.first() is None and CashierTransaction.query.first() is not None:
+            print(f"Built daily sales rollup: {rebuild_daily_sales()} rows")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Daily sales backfill note: {e}")
+
+@app.cli.command('rebuild-daily-sales')
+def rebuild_daily_sales_command():
+    """Rebuild the daily_sales rollup from all cashier transactions"""
+    rows = rebuild_daily_sales()
+    print(f"Rebuilt daily sales rollup: {rows} rows")
+
+SAVER_BALANCES_BACKFILL_COUNTER = 'saver_balances_backfill'
+
+def backfill_saver_balances():
+    """Fill stored saver balances once for databases that predate the balance column
+    
+    A marker in the counters table records that the backfill ran, so later
+    boots skip it and stored balances are only rebuilt on request.
+    """
+    try:
+        done = db.session.execute(db.text(
+            "SELECT value FROM counters WHERE name = :name"
+        ), {'name': SAVER_BALANCES_BACKFILL_COUNTER}).scalar()
+        if done:
+            return
+        
+        # Committed together with the rebuild below
+        db.session.execute(db.text(
+            "INSERT OR REPLACE INTO counters (name, value) VALUES (:name, 1)"
+        ), {'name': SAVER_BALANCES_BACKFILL_COUNTER})
+        print(f"Rebuilt balances of {rebuild_saver_balances()} savers")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Saver balance backfill note: {e}")
+
+@app.cli.command('snapshot-saver-balances')
+def snapshot_saver_balances_command():
+    """Rebuild month-end saver balance snapshots (run monthly, e.g. from cron)"""
+    print(f"Built {build_saver_balance_snapshots()} saver balance snapshots")
+
+@app.cli.command('verify-saver-balances')
+@click.option('--rebuild', is_flag=True, help='Recompute stored balances from the transaction history')
+def verify_saver_balances_command(rebuild):
+    """Compare stored saver balances with their transaction history"""
+    mismatches = find_saver_balance_mismatches()
+    for saver_id, name, stored, computed in mismatches:
+        print(f"{saver_id}\t{name}\tstored {stored:.2f}\tcomputed {computed:.2f}")
+    print(f"{len(mismatches)} saver balances differ from their transactions")
+    
+    if rebuild:
+        print(f"Rebuilt balances of {rebuild_saver_balances()} savers")
+
+def init_stock_snapshots():
+    """Take the opening stock snapshot, and a new one when the latest is older than STOCK_SNAPSHOT_INTERVAL"""
+    try:
+        latest = db.session.query(db.func.max(StockSnapshot.snapshot_at)).scalar()
+        if latest is None or datetime.now() - latest >= STOCK_SNAPSHOT_INTERVAL:
+            take_stock_snapshots()
+            print("Stock snapshot taken")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Stock snapshot note: {e}")
+
+@app.cli.command('prune-catalog-deletions')
+@click.option('--days', default=CATALOG_DELETION_RETENTION_DAYS, show_default=True, help='Keep tombstones this many days')
+def prune_catalog_deletions_command(days):
+    """Drop old product delete tombstones used by POS catalog sync (run daily, e.g. from cron)"""
+    print(f"Pruned {prune_catalog_deletions(days)} catalog delete tombstones")
+
+@app.cli.command('snapshot-stock')
+def snapshot_stock_command():
+    """Snapshot the stock of every product and inventory item (run daily, e.g. from cron)"""
+    snapshot_at = take_stock_snapshots()
+    print(f"Stock snapshot taken at {snapshot_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+@app.cli.command('forecast-products')
+def forecast_products_command():
+    """Recompute sales velocity, stockout and ABC forecasts for every product"""
+    started = time.monotonic()
+    count = compute_product_forecasts()
+    if count is None:
+        print("NumPy is not installed, install it with: pip install numpy")
+        return
+    print(f"Forecast {count} products in {time.monotonic() - started:.2f}s")
+
+@app.cli.command('import-products')
+@click.argument('path')
+@click.option('--errors', 'error_path', help='Write the row-level error report to this CSV file')
+def import_products_command(path, error_path):
+    """Bulk import products from a CSV file"""
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        report = import_products_csv(csv_file)
+    
+    print(f"Imported {report['imported']} of {report['total_rows']} rows, {len(report['errors'])} errors")
+    if error_path:
+        with open(error_path, 'w', newline='', encoding='utf-8') as error_file:
+            writer = csv.DictWriter(error_file, fieldnames=['row', 'id', 'message'])
+            writer.writeheader()
+            writer.writerows(report['errors'])
+    else:
+        for error in report['errors']:
+            print(f"  row {error['row']}: {error['message']}")
+
 def migrate_existing_products():
     """Migrate existing products to have new fields"""
     try:
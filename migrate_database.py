@@ -49,6 +49,7 @@ def migrate_database():
                 'total_sold': 'INTEGER NOT NULL DEFAULT 0',
                 'total_revenue': 'REAL NOT NULL DEFAULT 0',
                 'is_active': 'BOOLEAN DEFAULT 1',
+                'catalog_version': 'INTEGER NOT NULL DEFAULT 0',
                 'created_at': 'DATETIME DEFAULT CURRENT_TIMESTAMP',
                 'updated_at': 'DATETIME DEFAULT CURRENT_TIMESTAMP'
             }
@@ -106,6 +107,7 @@ def migrate_database():
                     total_sold INTEGER NOT NULL DEFAULT 0,
                     total_revenue REAL NOT NULL DEFAULT 0,
                     is_active BOOLEAN DEFAULT 1,
+                    catalog_version INTEGER NOT NULL DEFAULT 0,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
@@ -261,6 +263,7 @@ def migrate_database():
                     name TEXT UNIQUE NOT NULL,
                     phone TEXT,
                     address TEXT,
+                    balance REAL NOT NULL DEFAULT 0,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """),
@@ -291,6 +294,136 @@ def migrate_database():
                     FOREIGN KEY (cashier_id) REFERENCES users (id)
                 )
             """),
+            ('sale_lines', """
+                CREATE TABLE sale_lines (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    transaction_id INTEGER NOT NULL,
+                    product_id TEXT,
+                    product_name TEXT,
+                    quantity INTEGER NOT NULL,
+                    unit_price REAL NOT NULL DEFAULT 0,
+                    unit_cost REAL NOT NULL DEFAULT 0,
+                    subtotal REAL NOT NULL DEFAULT 0,
+                    FOREIGN KEY (transaction_id) REFERENCES cashier_transactions (id)
+                )
+            """),
+            ('sale_sync_keys', """
+                CREATE TABLE sale_sync_keys (
+                    key TEXT PRIMARY KEY,
+                    transaction_id INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (transaction_id) REFERENCES cashier_transactions (id)
+                )
+            """),
+            ('counters', """
+                CREATE TABLE counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """),
+            ('catalog_deletions', """
+                CREATE TABLE catalog_deletions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """),
+            ('daily_sales', """
+                CREATE TABLE daily_sales (
+                    date DATE NOT NULL,
+                    cashier_id INTEGER NOT NULL DEFAULT 0,
+                    txn_count INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    profit REAL NOT NULL DEFAULT 0,
+                    items INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (date, cashier_id)
+                )
+            """),
+            ('stock_movements', """
+                CREATE TABLE stock_movements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT,
+                    inventory_item_id INTEGER,
+                    delta INTEGER NOT NULL,
+                    reason TEXT NOT NULL,
+                    reference TEXT,
+                    user_id INTEGER,
+                    timestamp DATETIME NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """),
+            ('stock_snapshots', """
+                CREATE TABLE stock_snapshots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT,
+                    inventory_item_id INTEGER,
+                    stock INTEGER NOT NULL,
+                    last_movement_id INTEGER NOT NULL DEFAULT 0,
+                    snapshot_at DATETIME NOT NULL
+                )
+            """),
+            ('low_stock_watchlist', """
+                CREATE TABLE low_stock_watchlist (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT UNIQUE,
+                    inventory_item_id INTEGER UNIQUE,
+                    current_stock INTEGER NOT NULL,
+                    minimum_stock INTEGER NOT NULL,
+                    flagged_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """),
+            ('product_forecasts', """
+                CREATE TABLE product_forecasts (
+                    product_id TEXT PRIMARY KEY,
+                    avg_daily_7 REAL NOT NULL DEFAULT 0,
+                    avg_daily_30 REAL NOT NULL DEFAULT 0,
+                    smoothed_daily REAL NOT NULL DEFAULT 0,
+                    days_until_stockout REAL,
+                    reorder_point INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    abc_class TEXT NOT NULL DEFAULT 'C',
+                    computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (product_id) REFERENCES products (id)
+                )
+            """),
+            ('stock_takes', """
+                CREATE TABLE stock_takes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    status TEXT NOT NULL DEFAULT 'open',
+                    notes TEXT,
+                    created_by INTEGER,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    applied_at DATETIME,
+                    FOREIGN KEY (created_by) REFERENCES users (id)
+                )
+            """),
+            ('stock_take_counts', """
+                CREATE TABLE stock_take_counts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    stock_take_id INTEGER NOT NULL,
+                    product_id TEXT,
+                    inventory_item_id INTEGER,
+                    counted INTEGER NOT NULL DEFAULT 0,
+                    expected INTEGER,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (stock_take_id) REFERENCES stock_takes (id),
+                    FOREIGN KEY (product_id) REFERENCES products (id),
+                    FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id),
+                    CONSTRAINT uq_stock_take_counts_product UNIQUE (stock_take_id, product_id),
+                    CONSTRAINT uq_stock_take_counts_item UNIQUE (stock_take_id, inventory_item_id)
+                )
+            """),
+            ('saver_balance_snapshots', """
+                CREATE TABLE saver_balance_snapshots (
+                    saver_id INTEGER NOT NULL,
+                    month_end DATE NOT NULL,
+                    balance REAL NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (saver_id, month_end),
+                    FOREIGN KEY (saver_id) REFERENCES savers (id)
+                )
+            """),
             ('invoices', """
                 CREATE TABLE invoices (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,